@@ -26,8 +26,9 @@ from amiyabot.signalHandler import SignalHandler
 
 # lib
 from amiyabot.builtin.lib.eventBus import event_bus
-from amiyabot.builtin.lib.timedTask import TasksControl
+from amiyabot.builtin.lib.timedTask import TasksControl, TasksOptions
 from amiyabot.builtin.lib.browserService import BrowserLaunchConfig, basic_browser_service
+from amiyabot.builtin.lib.silkTranscoder import silk_transcoder
 
 # message
 from amiyabot.builtin.messageChain import Chain, ChainBuilder, InlineKeyboard, CQCode
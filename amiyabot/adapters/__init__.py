@@ -53,6 +53,7 @@ class BotAdapterProtocol:
         chain = await self.build_active_message_chain(chain, user_id, channel_id, direct_src_guild_id)
 
         async with self.bot.processing_context(chain):
+            chain.prerender()
             callback = await self.send_chain_message(chain, is_sync=True)
 
         return callback
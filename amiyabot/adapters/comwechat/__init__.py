@@ -28,7 +28,7 @@ class ComWeChatBotInstance(OneBot12Instance):
         reply = await build_message_send(self.api, chain)
 
         res = []
-        request = await self.api.post('/', self.api.ob12_action('send_message', reply))
+        request = await self.send_action('send_message', reply)
         if request:
             res.append(request)
 
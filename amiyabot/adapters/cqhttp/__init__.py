@@ -1,12 +1,27 @@
+from typing import Optional
 from amiyabot.adapters.onebot.v11 import OneBot11Instance
 
 from .api import CQHttpAPI
 from .forwardMessage import CQHTTPForwardMessage
 
 
-def cq_http(host: str, ws_port: int, http_port: int):
+def cq_http(
+    host: str,
+    ws_port: int,
+    http_port: int,
+    image_handoff_path: Optional[str] = None,
+    image_handoff_threshold: int = 256 * 1024,
+):
     def adapter(appid: str, token: str):
-        return CQHttpBotInstance(appid, token, host, ws_port, http_port)
+        return CQHttpBotInstance(
+            appid,
+            token,
+            host,
+            ws_port,
+            http_port,
+            image_handoff_path,
+            image_handoff_threshold,
+        )
 
     return adapter
 
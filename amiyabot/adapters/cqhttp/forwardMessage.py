@@ -35,7 +35,11 @@ class CQHTTPForwardMessage:
 
                 chain.data = source
 
-            chain_data, voice_list, cq_codes = await build_message_send(chain, chain_only=True)
+            chain_data, voice_list, cq_codes = await build_message_send(
+                chain,
+                chain_only=True,
+                handoff=self.data.instance.image_handoff,
+            )
 
             node['data']['content'] = chain_data
 
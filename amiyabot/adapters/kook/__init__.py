@@ -1,4 +1,3 @@
-import time
 import json
 import asyncio
 import dataclasses
@@ -9,7 +8,7 @@ from amiyabot.builtin.message import Message
 from amiyabot.builtin.messageChain import Chain
 from amiyabot.adapters import BotAdapterProtocol, ManualCloseException, HANDLER_TYPE
 
-from .package import package_kook_message, RolePermissionCache
+from .package import package_kook_message, role_permission_cache
 from .builder import build_message_send, KOOKMessageCallback
 from .api import KOOKAPI, log
 
@@ -135,23 +134,30 @@ class KOOKBotInstance(BotAdapterProtocol):
             await self.connection.close()
         self.connection = None
 
-    async def record_role_list(self, guild_id: str):
-        if guild_id in RolePermissionCache.cache_create_time:
-            if time.time() - RolePermissionCache.cache_create_time[guild_id] < 5:
-                return
+    def record_role_list(self, guild_id: str):
+        # 在后台刷新，消息分发不等待角色接口
+        if role_permission_cache.start_refresh(guild_id):
+            asyncio.create_task(self.refresh_role_list(guild_id))
 
-        res = await self.api.get('/guild-role/list', params={'guild_id': guild_id}, ignore_error=True)
-        if res and res.json['code'] == 0:
-            roles = {}
-            for item in res.json['data']['items']:
-                roles[item['role_id']] = item['permissions']
-
-            RolePermissionCache.guild_role[guild_id] = roles
-
-        elif guild_id in RolePermissionCache.guild_role:
-            del RolePermissionCache.guild_role[guild_id]
-
-        RolePermissionCache.cache_create_time[guild_id] = time.time()
+    async def refresh_role_list(self, guild_id: str):
+        refreshed = False
+        try:
+            async with log.catch('refresh role list error:'):
+                res = await self.api.get('/guild-role/list', params={'guild_id': guild_id}, ignore_error=True)
+                if res:
+                    roles = None
+                    if res.json['code'] == 0:
+                        roles = {}
+                        for item in res.json['data']['items']:
+                            roles[item['role_id']] = item['permissions']
+
+                    role_permission_cache.set(guild_id, roles)
+                    refreshed = True
+        finally:
+            if not refreshed:
+                role_permission_cache.retry_later(guild_id)
+            if role_permission_cache.finish_refresh(guild_id):
+                self.record_role_list(guild_id)
 
     async def close(self):
         log.info(f'closing {self}(appid {self.appid})...')
@@ -162,7 +168,12 @@ class KOOKBotInstance(BotAdapterProtocol):
         if message['type'] != 255:
             guild_id = message['extra'].get('guild_id', '')
             if guild_id:
-                await self.record_role_list(guild_id)
+                self.record_role_list(guild_id)
+
+        elif message['extra']['type'] in ('added_role', 'deleted_role', 'updated_role'):
+            # 角色事件的 target_id 为服务器 ID
+            role_permission_cache.invalidate(message['target_id'])
+            self.record_role_list(message['target_id'])
 
         return await package_kook_message(self, message)
 
@@ -1,13 +1,93 @@
 import json
+import time
 
-from typing import List, Dict
+from typing import List, Dict, Set, Optional
+from collections import OrderedDict
 from amiyabot.builtin.message import Event, Message, File
 from amiyabot.adapters import BotAdapterProtocol
 
 
 class RolePermissionCache:
-    guild_role: Dict[str, Dict[str, int]] = {}
-    cache_create_time: Dict[str, float] = {}
+    def __init__(self, ttl: int = 1800, max_size: int = 1024):
+        """
+        频道角色权限缓存，过期的条目仍可读取，由后台任务刷新
+
+        :param ttl:      条目的有效时间（秒），过期后在下次访问时触发刷新
+        :param max_size: 最多记录的频道数，超出时淘汰最久未刷新的频道
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.guild_role: Dict[str, Dict[str, int]] = {}
+        self.refresh_time: OrderedDict[str, float] = OrderedDict()
+        self.refreshing: Set[str] = set()
+        # 刷新期间收到角色变更的频道，刷新结束后需要再次刷新
+        self.dirty: Set[str] = set()
+
+    def get(self, guild_id: str) -> Optional[Dict[str, int]]:
+        return self.guild_role.get(guild_id)
+
+    def set(self, guild_id: str, roles: Optional[Dict[str, int]]):
+        if roles is None:
+            self.guild_role.pop(guild_id, None)
+        else:
+            self.guild_role[guild_id] = roles
+
+        self.__touch(guild_id, time.monotonic())
+
+    def need_refresh(self, guild_id: str):
+        if guild_id in self.refreshing:
+            return False
+
+        refresh_time = self.refresh_time.get(guild_id)
+
+        return refresh_time is None or time.monotonic() - refresh_time >= self.ttl
+
+    def start_refresh(self, guild_id: str):
+        """
+        :return: 是否需要刷新，需要时标记为刷新中
+        """
+        if not self.need_refresh(guild_id):
+            return False
+
+        self.refreshing.add(guild_id)
+
+        return True
+
+    def finish_refresh(self, guild_id: str):
+        """
+        :return: 刷新期间是否收到了角色变更，需要再次刷新
+        """
+        self.refreshing.discard(guild_id)
+
+        if guild_id in self.dirty:
+            self.dirty.discard(guild_id)
+            self.refresh_time.pop(guild_id, None)
+            return True
+
+        return False
+
+    def invalidate(self, guild_id: str):
+        self.refresh_time.pop(guild_id, None)
+
+        # 正在进行的刷新可能已取得变更前的数据
+        if guild_id in self.refreshing:
+            self.dirty.add(guild_id)
+
+    def retry_later(self, guild_id: str, delay: int = 30):
+        # 刷新失败时保留旧数据，并在 delay 秒后才允许再次刷新
+        self.__touch(guild_id, time.monotonic() - self.ttl + delay)
+
+    def __touch(self, guild_id: str, refresh_time: float):
+        self.refresh_time[guild_id] = refresh_time
+        self.refresh_time.move_to_end(guild_id)
+
+        while len(self.refresh_time) > self.max_size:
+            expired, _ = self.refresh_time.popitem(last=False)
+            self.guild_role.pop(expired, None)
+
+
+role_permission_cache = RolePermissionCache()
 
 
 async def package_kook_message(instance: BotAdapterProtocol, message: dict):
@@ -37,12 +117,13 @@ async def package_kook_message(instance: BotAdapterProtocol, message: dict):
     data.nickname = user['nickname'] or user['username']
     data.avatar = user['vip_avatar'] or user['avatar']
 
-    if data.guild_id in RolePermissionCache.guild_role:
+    guild_role = role_permission_cache.get(data.guild_id)
+    if guild_role:
         for item in user['roles']:
-            if item not in RolePermissionCache.guild_role[data.guild_id]:
+            if item not in guild_role:
                 continue
 
-            permission = RolePermissionCache.guild_role[data.guild_id][item]
+            permission = guild_role[item]
             if permission & (1 << 0) == (1 << 0) or permission & (1 << 1) == (1 << 1):
                 data.is_admin = True
 
@@ -10,7 +10,7 @@ from amiyalog import LoggerManager
 
 from .forwardMessage import MiraiForwardMessage
 from .package import package_mirai_message
-from .builder import build_message_send, MiraiMessageCallback
+from .builder import build_message_send, MediaIdCache, MiraiMessageCallback
 from .api import MiraiAPI
 
 log = LoggerManager('Mirai')
@@ -36,6 +36,7 @@ class MiraiBotInstance(BotAdapterProtocol):
         self.http_port = http_port
 
         self.session = None
+        self.media_id_cache = MediaIdCache()
 
     def __str__(self):
         return 'Mirai'
@@ -83,6 +84,7 @@ class MiraiBotInstance(BotAdapterProtocol):
 
             if 'session' in data:
                 self.session = data['session']
+                self.media_id_cache.bind_session(self.session)
                 log.info(f'websocket({self.appid}) handshake successful. session: ' + self.session)
                 return None
 
@@ -93,7 +95,7 @@ class MiraiBotInstance(BotAdapterProtocol):
             )
 
     async def send_chain_message(self, chain: Chain, is_sync: bool = False):
-        reply, voice_list = await build_message_send(self.api, chain, use_http=is_sync)
+        reply, voice_list = await build_message_send(self.api, chain, use_http=is_sync, id_cache=self.media_id_cache)
 
         res = []
 
@@ -1,8 +1,10 @@
 import time
+import hashlib
 
 from typing import Type
-from graiax import silkcoder
 from amiyabot.adapters import MessageCallback
+from amiyabot.builtin.lib.silkTranscoder import silk_transcoder
+from amiyabot.builtin.lib.ttlCache import TTLCache
 from amiyabot.builtin.messageChain import Chain
 from amiyabot.builtin.messageChain.element import *
 from amiyautils import is_valid_url
@@ -11,6 +13,26 @@ from .payload import WebsocketAdapter, HttpAdapter, MiraiPostPayload
 from .api import MiraiAPI
 
 
+class MediaIdCache(TTLCache):
+    def __init__(self, max_size: int = 1024, ttl: int = 600):
+        """
+        上传媒体得到的 imageId / voiceId 缓存，键为 (session, 消息类型, 媒体类型, 内容哈希)
+
+        缓存的只是本进程上传得到的 ID，因此不会复用 Mirai 为相同内容保存的旧 ID，缓存时间不宜过长
+
+        :param max_size: 最大条目数
+        :param ttl:      缓存时间（秒）
+        """
+        super().__init__(max_size, ttl)
+        self.session = None
+
+    def bind_session(self, session: str):
+        # 会话变更后旧的 ID 不再可用
+        if session != self.session:
+            self.clear()
+            self.session = session
+
+
 class MiraiMessageCallback(MessageCallback):
     async def recall(self):
         if not self.response:
@@ -29,6 +51,7 @@ async def build_message_send(
     custom_chain: Optional[CHAIN_LIST] = None,
     chain_only: bool = False,
     use_http: bool = False,
+    id_cache: Optional[MediaIdCache] = None,
 ):
     chain_list = custom_chain or chain.chain
     chain_data = []
@@ -63,7 +86,7 @@ async def build_message_send(
                     chain_data.append(
                         {
                             'type': 'Image',
-                            'imageId': await get_image_id(api, target, chain.data.message_type),
+                            'imageId': await get_image_id(api, target, chain.data.message_type, id_cache),
                         }
                     )
 
@@ -71,7 +94,7 @@ async def build_message_send(
             if isinstance(item, Voice):
                 voice_item = {
                     'type': 'Voice',
-                    'voiceId': await get_voice_id(api, item.file, chain.data.message_type),
+                    'voiceId': await get_voice_id(api, item.file, chain.data.message_type, id_cache),
                 }
                 if chain_only:
                     voice_list.append(voice_item)
@@ -85,7 +108,7 @@ async def build_message_send(
                     chain_data.append(
                         {
                             'type': 'Image',
-                            'imageId': await get_image_id(api, result, chain.data.message_type),
+                            'imageId': await get_image_id(api, result, chain.data.message_type, id_cache),
                         }
                     )
 
@@ -99,19 +122,58 @@ async def build_message_send(
     return select_type(chain, api.session, chain_data, payload_builder), voice_list
 
 
-async def get_image_id(http: MiraiAPI, target: Union[str, bytes], msg_type: str):
+async def get_image_id(
+    http: MiraiAPI,
+    target: Union[str, bytes],
+    msg_type: str,
+    id_cache: Optional[MediaIdCache] = None,
+):
     if isinstance(target, str):
         with open(target, mode='rb') as file:
             target = file.read()
 
+    cache_key = None
+    if id_cache is not None:
+        id_cache.bind_session(http.session)
+
+        cache_key = (http.session, msg_type, 'image', hashlib.sha256(target).hexdigest())
+        image_id = id_cache.get(cache_key)
+        if image_id:
+            return image_id
+
     # 在图片里夹点私货，让 Mirai 返回不一样的 ID
+    # 避免相同内容得到 Mirai 以前保存的可能已失效的 ID，缓存中的 ID 则来自这里新上传的结果，在 ttl 内复用是安全的
     target += str(time.time()).encode()
 
-    return await http.upload_image(target, msg_type)
+    image_id = await http.upload_image(target, msg_type)
+    if image_id and cache_key:
+        id_cache.set(cache_key, image_id)
+
+    return image_id
+
+
+async def get_voice_id(
+    http: MiraiAPI,
+    path: str,
+    msg_type: str,
+    id_cache: Optional[MediaIdCache] = None,
+):
+    voice = await silk_transcoder.encode(path)
+
+    cache_key = None
+    if id_cache is not None:
+        id_cache.bind_session(http.session)
+
+        cache_key = (http.session, msg_type, 'voice', hashlib.sha256(voice).hexdigest())
+        voice_id = id_cache.get(cache_key)
+        if voice_id:
+            return voice_id
 
+    voice_id = await http.upload_voice(voice, msg_type)
+    if voice_id and cache_key:
+        id_cache.set(cache_key, voice_id)
 
-async def get_voice_id(http: MiraiAPI, path: str, msg_type: str):
-    return await http.upload_voice(await silkcoder.async_encode(path, ios_adaptive=True), msg_type)
+    return voice_id
 
 
 def select_type(
@@ -30,7 +30,12 @@ class MiraiForwardMessage:
 
                 chain.data = source
 
-            chain_data, voice_list = await build_message_send(self.api, chain, chain_only=True)
+            chain_data, voice_list = await build_message_send(
+                self.api,
+                chain,
+                chain_only=True,
+                id_cache=self.data.instance.media_id_cache,
+            )
 
             node['senderId'] = chain.data.user_id
             node['senderName'] = chain.data.nickname
@@ -1,23 +1,38 @@
-import json
 import asyncio
-import websockets
 
 from typing import Callable, Optional
+from functools import partial
+from websockets.asyncio.client import ClientConnection
+from amiyalog import LoggerManager
 from amiyabot.adapters import BotAdapterProtocol, HANDLER_TYPE
+from amiyabot.adapters.onebot.wsActions import WebsocketActions
 from amiyabot.builtin.message import Message
 from amiyabot.builtin.messageChain import Chain
-from amiyalog import LoggerManager
 
 from .package import package_onebot11_message
-from .builder import build_message_send, OneBot11MessageCallback
+from .builder import build_message_send, ImageHandoff, OneBot11MessageCallback
 from .api import OneBot11API
 
 log = LoggerManager('OneBot11')
 
 
-def onebot11(host: str, ws_port: int, http_port: int):
+def onebot11(
+    host: str,
+    ws_port: int,
+    http_port: int,
+    image_handoff_path: Optional[str] = None,
+    image_handoff_threshold: int = 256 * 1024,
+):
     def adapter(appid: str, token: str):
-        return OneBot11Instance(appid, token, host, ws_port, http_port)
+        return OneBot11Instance(
+            appid,
+            token,
+            host,
+            ws_port,
+            http_port,
+            image_handoff_path,
+            image_handoff_threshold,
+        )
 
     return adapter
 
@@ -30,21 +45,31 @@ class OneBot11Instance(BotAdapterProtocol):
         host: str,
         ws_port: int,
         http_port: int,
+        image_handoff_path: Optional[str] = None,
+        image_handoff_threshold: int = 256 * 1024,
     ):
         super().__init__(appid, token)
 
         self.url = f'ws://{host}:{ws_port}/'
         self.headers = {'Authorization': f'Bearer {token}'}
 
-        self.connection: Optional[websockets.WebSocketClientProtocol] = None
+        self.ws_actions = WebsocketActions()
 
         self.host = host
         self.ws_port = ws_port
         self.http_port = http_port
 
+        self.image_handoff: Optional[ImageHandoff] = None
+        if image_handoff_path:
+            self.image_handoff = ImageHandoff(image_handoff_path, image_handoff_threshold)
+
     def __str__(self):
         return 'OneBot11'
 
+    @property
+    def connection(self) -> Optional[ClientConnection]:
+        return self.ws_actions.connection
+
     @property
     def api(self):
         return OneBot11API(self.host, self.http_port, self.token)
@@ -53,10 +78,16 @@ class OneBot11Instance(BotAdapterProtocol):
         log.info(f'closing {self}(appid {self.appid})...')
         self.keep_run = False
 
+        if self.image_handoff:
+            await self.image_handoff.stop()
+
         if self.connection:
             await self.connection.close()
 
     async def start(self, handler: HANDLER_TYPE):
+        if self.image_handoff:
+            self.image_handoff.start()
+
         while self.keep_run:
             await self.keep_connect(handler)
             await asyncio.sleep(10)
@@ -67,40 +98,35 @@ class OneBot11Instance(BotAdapterProtocol):
         async with self.get_websocket_connection(mark, self.url, self.headers) as websocket:
             if websocket:
                 log.info(f'{mark} connect successful.')
-                self.connection = websocket
-
-                while self.keep_run:
-                    message = await websocket.recv()
 
-                    if message == b'':
-                        await websocket.close()
-                        log.warning(f'{mark} server already closed this connection.')
-                        return None
+                async def dispatch(data: dict):
+                    asyncio.create_task(
+                        handler(
+                            await package_method(self, self.appid, data),
+                        ),
+                    )
 
-                    async with log.catch(ignore=[json.JSONDecodeError]):
-                        asyncio.create_task(
-                            handler(
-                                await package_method(self, self.appid, json.loads(message)),
-                            ),
-                        )
-
-                await websocket.close()
+                await self.ws_actions.receive(websocket, mark, lambda: self.keep_run, dispatch)
 
     async def send_chain_message(self, chain: Chain, is_sync: bool = False):
-        reply, voice_list, cq_codes = await build_message_send(chain)
+        reply, voice_list, cq_codes = await build_message_send(chain, handoff=self.image_handoff)
 
         res = []
 
         for reply_list in [[reply], cq_codes, voice_list]:
             for item in reply_list:
                 if is_sync:
-                    request = await self.api.post('/send_msg', item)
+                    request = await self.send_action('send_msg', item)
                     res.append(request)
                 else:
-                    await self.connection.send(json.dumps({'action': 'send_msg', 'params': item}))
+                    await self.ws_actions.send('send_msg', item, partial(self.api.post, '/send_msg', item))
 
         return [OneBot11MessageCallback(chain.data, self, item) for item in res]
 
+    async def send_action(self, action: str, params: dict):
+        # 已连接时复用 websocket，否则使用 HTTP API
+        return await self.ws_actions.call(action, params, lambda: self.api.post('/' + action, params))
+
     async def build_active_message_chain(self, chain: Chain, user_id: str, channel_id: str, direct_src_guild_id: str):
         data = Message(self)
 
@@ -1,7 +1,9 @@
 import base64
+import pathlib
 
-from graiax import silkcoder
 from amiyabot.adapters import MessageCallback
+from amiyabot.builtin.lib.mediaStore import DiskMediaStore
+from amiyabot.builtin.lib.silkTranscoder import silk_transcoder
 from amiyabot.builtin.messageChain import Chain
 from amiyabot.builtin.messageChain.element import *
 from amiyautils import is_valid_url
@@ -38,7 +40,44 @@ class OneBot11MessageCallback(MessageCallback):
             )
 
 
-async def build_message_send(chain: Chain, chain_only: bool = False):
+class ImageHandoff:
+    def __init__(self, path: str, threshold: int = 256 * 1024, max_age: int = 600):
+        """
+        通过共享目录以 file:// 路径传递较大的图片，避免 base64 编码及 JSON 序列化的开销
+        仅适用于与 OneBot 实现运行在同一台机器（或挂载了同一目录）的场景
+
+        :param path:      共享目录，OneBot 实现需要能以相同的绝对路径读取
+        :param threshold: 超过该大小（字节）的图片才使用共享目录传递
+        :param max_age:   文件在最后一次使用后的保留时间（秒），到期后自动清理
+        """
+        self.path = os.path.abspath(path)
+        self.threshold = threshold
+        self.store = DiskMediaStore(self.path, max_age)
+
+    def start(self):
+        self.store.start()
+
+    async def stop(self):
+        await self.store.stop()
+
+    async def file_url(self, img: bytes):
+        filename = await self.store.save(img, image_suffix(img))
+
+        # 文件交由清理任务在 max_age 后删除，届时 OneBot 实现早已读取完毕
+        self.store.release(filename)
+
+        return pathlib.Path(self.store.file_path(filename)).as_uri()
+
+
+def image_suffix(img: bytes):
+    if img.startswith(b'\xff\xd8'):
+        return 'jpg'
+    if img.startswith(b'GIF8'):
+        return 'gif'
+    return 'png'
+
+
+async def build_message_send(chain: Chain, chain_only: bool = False, handoff: Optional[ImageHandoff] = None):
     chain_list = chain.chain
     chain_data = []
     voice_list = []
@@ -68,7 +107,7 @@ async def build_message_send(chain: Chain, chain_only: bool = False):
             # Image
             if isinstance(item, Image):
                 img = await item.get()
-                chain_data.append(await append_image(img))
+                chain_data.append(await append_image(img, handoff))
 
             # Voice
             if isinstance(item, Voice):
@@ -82,7 +121,7 @@ async def build_message_send(chain: Chain, chain_only: bool = False):
             if isinstance(item, Html):
                 result = await item.create_html_image()
                 if result:
-                    chain_data.append(await append_image(result))
+                    chain_data.append(await append_image(result, handoff))
 
             # Extend
             if isinstance(item, Extend):
@@ -98,8 +137,10 @@ async def build_message_send(chain: Chain, chain_only: bool = False):
     return send_msg(chain, chain_data), voice_list, cq_codes
 
 
-async def append_image(img: Union[bytes, str]):
-    if isinstance(img, bytes):
+async def append_image(img: Union[bytes, str], handoff: Optional[ImageHandoff] = None):
+    if isinstance(img, bytes) and handoff and len(img) >= handoff.threshold:
+        data = {'file': await handoff.file_url(img)}
+    elif isinstance(img, bytes):
         data = {'file': 'base64://' + base64.b64encode(img).decode()}
     elif is_valid_url(img):
         data = {'url': img}
@@ -111,7 +152,7 @@ async def append_image(img: Union[bytes, str]):
 
 async def append_voice(file: str):
     if os.path.exists(file):
-        file = 'base64://' + base64.b64encode(await silkcoder.async_encode(file, ios_adaptive=True)).decode()
+        file = 'base64://' + base64.b64encode(await silk_transcoder.encode(file)).decode()
 
     return {'type': 'record', 'data': {'file': file}}
 
@@ -1,12 +1,12 @@
-import json
 import asyncio
-import websockets
 
 from typing import Callable, Optional
+from websockets.asyncio.client import ClientConnection
+from amiyalog import LoggerManager
 from amiyabot.adapters import BotAdapterProtocol, HANDLER_TYPE
+from amiyabot.adapters.onebot.wsActions import WebsocketActions
 from amiyabot.builtin.message import Message
 from amiyabot.builtin.messageChain import Chain
-from amiyalog import LoggerManager
 
 from .package import package_onebot12_message
 from .builder import build_message_send, OneBot12MessageCallback
@@ -36,7 +36,7 @@ class OneBot12Instance(BotAdapterProtocol):
         self.url = f'ws://{host}:{ws_port}/'
         self.headers = {'Authorization': f'Bearer {token}'}
 
-        self.connection: Optional[websockets.WebSocketClientProtocol] = None
+        self.ws_actions = WebsocketActions()
 
         self.host = host
         self.ws_port = ws_port
@@ -45,6 +45,10 @@ class OneBot12Instance(BotAdapterProtocol):
     def __str__(self):
         return 'OneBot12'
 
+    @property
+    def connection(self) -> Optional[ClientConnection]:
+        return self.ws_actions.connection
+
     @property
     def api(self):
         return OneBot12API(self.host, self.http_port, self.token)
@@ -67,35 +71,32 @@ class OneBot12Instance(BotAdapterProtocol):
         async with self.get_websocket_connection(mark, self.url, self.headers) as websocket:
             if websocket:
                 log.info(f'{mark} connect successful.')
-                self.connection = websocket
 
-                while self.keep_run:
-                    message = await websocket.recv()
+                async def dispatch(data: dict):
+                    asyncio.create_task(
+                        handler(
+                            await package_method(self, data),
+                        ),
+                    )
 
-                    if message == b'':
-                        await websocket.close()
-                        log.warning(f'{mark} server already closed this connection.')
-                        return None
-
-                    async with log.catch(ignore=[json.JSONDecodeError]):
-                        asyncio.create_task(
-                            handler(
-                                await package_method(self, json.loads(message)),
-                            ),
-                        )
-
-                await websocket.close()
+                await self.ws_actions.receive(websocket, mark, lambda: self.keep_run, dispatch)
 
     async def send_chain_message(self, chain: Chain, is_sync: bool = False):
         reply = await build_message_send(self.api, chain)
 
         res = []
-        request = await self.api.post('/', self.api.ob12_action('send_message', reply))
+        request = await self.send_action('send_message', reply)
         if request:
             res.append(request)
 
         return [OneBot12MessageCallback(chain.data, self, item) for item in res]
 
+    async def send_action(self, action: str, params: dict):
+        # 已连接时复用 websocket，否则使用 HTTP API
+        return await self.ws_actions.call(
+            action, params, lambda: self.api.post('/', self.api.ob12_action(action, params))
+        )
+
     async def build_active_message_chain(self, chain: Chain, user_id: str, channel_id: str, direct_src_guild_id: str):
         data = Message(self)
 
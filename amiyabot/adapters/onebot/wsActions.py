@@ -0,0 +1,126 @@
+import json
+import asyncio
+
+from typing import Any, Dict, Callable, Awaitable, Optional
+from websockets.asyncio.client import ClientConnection
+from websockets.exceptions import ConnectionClosed
+from amiyautils import random_code
+from amiyautils.httpRequestsUtils import Response
+from amiyalog import logger as log
+
+HTTP_FALLBACK = Callable[[], Awaitable[Any]]
+
+
+class WebsocketActions:
+    def __init__(self, timeout: float = 30):
+        """
+        通过 websocket 连接调用 OneBot 动作，使用 echo 字段将响应与请求对应
+
+        :param timeout: 等待响应的超时时间（秒）
+        """
+        self.timeout = timeout
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.connection: Optional[ClientConnection] = None
+
+    async def receive(
+        self,
+        websocket: ClientConnection,
+        mark: str,
+        keep_run: Callable[[], bool],
+        dispatch: Callable[[dict], Awaitable[Any]],
+    ):
+        """
+        接收 websocket 消息直到连接断开，动作响应交由等待中的请求处理，其余数据交由 dispatch 处理
+
+        :param websocket: websocket 连接
+        :param mark:      日志标记
+        :param keep_run:  返回是否继续接收
+        :param dispatch:  事件数据的处理方法
+        """
+        self.connection = websocket
+        try:
+            while keep_run():
+                message = await websocket.recv()
+
+                if message == b'':
+                    await websocket.close()
+                    log.warning(f'{mark} server already closed this connection.')
+                    return None
+
+                async with log.catch(ignore=[json.JSONDecodeError]):
+                    data = json.loads(message)
+
+                    if not self.resolve(data):
+                        await dispatch(data)
+
+            await websocket.close()
+        finally:
+            self.connection = None
+            self.cancel_all()
+
+    async def call(self, action: str, params: dict, fallback: HTTP_FALLBACK) -> Optional[Response]:
+        """
+        调用动作并等待响应，未连接或发送时连接已断开则使用 fallback（HTTP API）
+        """
+        if self.connection:
+            try:
+                return await self.request(self.connection, action, params)
+            except ConnectionClosed as e:
+                log.warning(f'websocket action "{action}" send failed, fallback to http: {repr(e)}')
+
+        return await fallback()
+
+    async def send(self, action: str, params: dict, fallback: HTTP_FALLBACK):
+        """
+        调用动作且不等待响应，未连接或发送时连接已断开则使用 fallback（HTTP API）
+        """
+        if self.connection:
+            try:
+                await self.connection.send(json.dumps({'action': action, 'params': params}))
+                return None
+            except ConnectionClosed as e:
+                log.warning(f'websocket action "{action}" send failed, fallback to http: {repr(e)}')
+
+        await fallback()
+
+    async def request(self, connection: ClientConnection, action: str, params: dict) -> Optional[Response]:
+        echo = random_code(16)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[echo] = future
+        try:
+            # 发送失败时动作未送达，由调用方决定是否改用 HTTP API
+            await connection.send(json.dumps({'action': action, 'params': params, 'echo': echo}))
+
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            log.warning(f'websocket action "{action}" timeout after {self.timeout}s.')
+        except ConnectionError as e:
+            # 已发送但连接在响应前断开，动作可能已执行，不再重试
+            log.warning(f'websocket action "{action}" failed: {repr(e)}')
+        finally:
+            self.pending.pop(echo, None)
+
+    def resolve(self, data: dict):
+        """
+        将收到的数据作为动作响应处理
+
+        :return: 数据是否为某个等待中的动作的响应
+        """
+        echo = data.get('echo') if isinstance(data, dict) else None
+        if not isinstance(echo, str) or echo not in self.pending:
+            return False
+
+        future = self.pending.pop(echo)
+        if not future.done():
+            future.set_result(Response(json.dumps(data)))
+
+        return True
+
+    def cancel_all(self):
+        # 连接断开后不会再收到响应
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('websocket connection closed.'))
+
+        self.pending.clear()
@@ -11,6 +11,7 @@ from .builder import (
     QQGroupChainBuilder,
     QQGroupChainBuilderOptions,
     SeqService,
+    UploadCache,
     build_message_send,
 )
 from .package import package_qq_group_message
@@ -31,6 +32,7 @@ class QQGroupBotInstance(QQGuildBotInstance):
         self.__access_token_api = QQGroupAPI(self.appid, self.token, client_secret)
         self.__default_chain_builder = default_chain_builder
         self.__seq_service = SeqService()
+        self.__upload_cache = UploadCache()
 
     def __str__(self):
         return 'QQGroup'
@@ -79,7 +81,7 @@ class QQGroupBotInstance(QQGuildBotInstance):
         if not isinstance(chain.builder, QQGroupChainBuilder):
             chain.builder = self.__default_chain_builder
 
-        payloads = await build_message_send(self.api, chain, self.__seq_service)
+        payloads = await build_message_send(self.api, chain, self.__seq_service, self.__upload_cache)
         res = []
 
         for payload in payloads:
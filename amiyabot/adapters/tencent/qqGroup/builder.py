@@ -1,12 +1,16 @@
+import re
 import time
-import shutil
 
-from graiax import silkcoder
+from collections import OrderedDict
+from fastapi import Request, Response
 from amiyahttp import HttpServer, ServerConfig
 from contextlib import contextmanager
 from dataclasses import dataclass, asdict, field
-from amiyautils import create_dir, get_public_ip, random_code
+from amiyautils import get_public_ip
 from amiyabot.adapters import MessageCallback
+from amiyabot.builtin.lib.silkTranscoder import silk_transcoder
+from amiyabot.builtin.lib.mediaStore import MediaFile, DiskMediaStore, MemoryMediaStore
+from amiyabot.builtin.lib.ttlCache import TTLCache
 from amiyabot.builtin.messageChain import Chain
 from amiyabot.builtin.messageChain.element import *
 
@@ -14,17 +18,31 @@ from .api import QQGroupAPI, log
 
 
 class SeqService:
-    def __init__(self):
-        self.seq_rec = {}
+    def __init__(self, expire: int = 300):
+        # 记录按创建时间排列，过期只需从头部依次弹出
+        self.seq_rec: OrderedDict[str, List[float]] = OrderedDict()
+        self.expire = expire
         self.alive = False
 
     def msg_req(self, msg_id: str):
+        now = time.monotonic()
+        self.evict(now)
+
         if msg_id not in self.seq_rec:
-            self.seq_rec[msg_id] = {'last': time.time(), 'seq': 0}
+            self.seq_rec[msg_id] = [now, 0]
+
+        self.seq_rec[msg_id][1] += 1
 
-        self.seq_rec[msg_id]['seq'] += 1
+        return self.seq_rec[msg_id][1]
 
-        return self.seq_rec[msg_id]['seq']
+    def evict(self, now: Optional[float] = None):
+        deadline = (time.monotonic() if now is None else now) - self.expire
+
+        while self.seq_rec:
+            msg_id, item = next(iter(self.seq_rec.items()))
+            if item[0] > deadline:
+                break
+            del self.seq_rec[msg_id]
 
     async def run(self):
         if not self.alive:
@@ -32,7 +50,7 @@ class SeqService:
 
             while self.alive:
                 await asyncio.sleep(1)
-                self.seq_rec = {m_id: item for m_id, item in self.seq_rec.items() if time.time() - item['last'] < 300}
+                self.evict()
 
     async def stop(self):
         self.alive = False
@@ -70,22 +88,29 @@ class QQGroupChainBuilderOptions:
     host: str = '0.0.0.0'
     port: int = 8086
     resource_path: str = './resource'
+    # 将资源保存在内存中并直接由 HTTP 服务提供，不再写入 resource_path
+    resource_in_memory: bool = False
+    # 资源文件在最后一次使用后的保留时间（秒）与资源目录的最大总大小（字节）
+    resource_max_age: int = 600
+    resource_max_size: int = 512 * 1024 * 1024
     server_config: ServerConfig = field(default_factory=ServerConfig)
 
 
 class QQGroupChainBuilder(ChainBuilder, metaclass=PortSingleton):
     def __init__(self, options: QQGroupChainBuilderOptions):
-        create_dir(options.resource_path)
-
         self.server = HttpServer(options.host, options.port, options.server_config)
-        self.server.add_static_folder('/resource', options.resource_path)
+
+        if options.resource_in_memory:
+            self.store = MemoryMediaStore(options.resource_max_age, options.resource_max_size)
+            self.server.app.add_api_route('/resource/{filename}', self.serve_resource, methods=['GET', 'HEAD'])
+        else:
+            self.store = DiskMediaStore(options.resource_path, options.resource_max_age, options.resource_max_size)
+            self.server.add_static_folder('/resource', options.resource_path)
 
         self.ip = options.host if options.host != '0.0.0.0' else get_public_ip()
         self.http = 'https' if self.server.server.config.is_ssl else 'http'
         self.options = options
 
-        self.file_caches = {}
-
         self.running = False
 
     @property
@@ -95,53 +120,69 @@ class QQGroupChainBuilder(ChainBuilder, metaclass=PortSingleton):
     def start(self):
         if not self.running:
             asyncio.create_task(self.server.serve())
+            self.store.start()
         self.running = True
 
-    def temp_filename(self, suffix: str):
-        filename = f'{int(time.time())}{random_code(10)}.{suffix}'
-        path = f'{self.options.resource_path}/{filename}'
-        url = f'{self.domain}/{filename}'
+    async def serve_resource(self, filename: str, request: Request):
+        item = self.store.get(filename)
+        if not item or item.content is None:
+            return Response(status_code=404)
 
-        create_dir(path, is_file=True)
-
-        self.file_caches[url] = path
-
-        return path, url
+        return media_response(item, request.headers.get('range'))
 
     def remove_file(self, url: str):
-        if url in self.file_caches:
-            os.remove(self.file_caches[url])
-            del self.file_caches[url]
+        if url.startswith(self.domain):
+            self.store.release(url.split('/')[-1])
+
+    def content_hash(self, url: str) -> Optional[str]:
+        # 资源文件以内容哈希命名，相同的 url 即相同的内容
+        if url.startswith(self.domain):
+            return url.split('/')[-1].split('.')[0]
 
     async def get_image(self, image: Union[str, bytes]) -> Union[str, bytes]:
         if isinstance(image, bytes):
-            path, url = self.temp_filename('png')
-
-            with open(path, mode='wb') as f:
-                f.write(image)
-
-            return url
+            return f'{self.domain}/{await self.store.save(image, "png")}'
         return image
 
     async def get_voice(self, voice_file: str) -> str:
         if voice_file.startswith('http'):
             return voice_file
 
-        voice = await silkcoder.async_encode(voice_file, ios_adaptive=True)
-        path, url = self.temp_filename('silk')
-
-        with open(path, mode='wb') as f:
-            f.write(voice)
+        voice = await silk_transcoder.encode(voice_file)
 
-        return url
+        return f'{self.domain}/{await self.store.save(voice, "silk")}'
 
     async def get_video(self, video_file: str) -> str:
         if video_file.startswith('http'):
             return video_file
 
-        path, url = self.temp_filename('mp4')
-        shutil.copy(video_file, path)
-        return url
+        return f'{self.domain}/{await self.store.save_file(video_file, "mp4")}'
+
+
+def media_response(item: MediaFile, range_header: Optional[str] = None):
+    content = item.content
+    size = len(content)
+    headers = {'Accept-Ranges': 'bytes'}
+
+    # 仅支持单一区间的 Range 请求，其他格式按完整内容返回
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (range_header or '').strip())
+    if match and any(match.groups()):
+        start, end = match.groups()
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        else:
+            start = max(size - int(end), 0)
+            end = size - 1
+
+        if start > end or start >= size:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        return Response(content[start : end + 1], status_code=206, headers=headers, media_type=item.content_type)
+
+    return Response(content, headers=headers, media_type=item.content_type)
 
 
 class QQGroupMessageCallback(MessageCallback):
@@ -150,11 +191,49 @@ class QQGroupMessageCallback(MessageCallback):
     async def get_message(self): ...
 
 
+class UploadCache(TTLCache):
+    def __init__(self, max_size: int = 2048, default_ttl: int = 3600):
+        """
+        上传文件返回的 file_info 缓存，键为 (目标 openid, 文件类型, 内容哈希)
+
+        :param max_size:    最大条目数
+        :param default_ttl: 平台返回的 ttl 为 0（长期有效）时使用的缓存时间（秒）
+        """
+        super().__init__(max_size, default_ttl)
+
+    def set_file_info(self, key: tuple, file_info: str, ttl: int = 0):
+        # 提前一些使缓存过期，避免发送时 file_info 刚好失效
+        self.set(key, file_info, max(ttl - 30, 0) if ttl else None)
+
+
+MEDIA_FILE_TYPES = {
+    Image: 1,
+    Html: 1,
+    Video: 2,
+    Voice: 3,
+}
+
+
+def media_file_type(item: CHAIN_ITEM) -> Optional[int]:
+    for element, file_type in MEDIA_FILE_TYPES.items():
+        if isinstance(item, element):
+            return file_type
+
+
 class PayloadBuilder:
-    def __init__(self, api: QQGroupAPI, chain: Chain, seq_service: SeqService):
+    def __init__(
+        self,
+        api: QQGroupAPI,
+        chain: Chain,
+        seq_service: SeqService,
+        upload_cache: Optional[UploadCache] = None,
+        concurrency: int = 4,
+    ):
         self.api = api
         self.chain = chain
         self.seq_service = seq_service
+        self.upload_cache = upload_cache
+        self.concurrency = max(concurrency, 1)
 
         self.chain_list = chain.chain
         self.msg_id = chain.data.message_id
@@ -175,57 +254,93 @@ class PayloadBuilder:
         self.refresh_payload()
 
     async def insert_media(self, url: str, file_type: int = 1):
-        if not isinstance(url, str):
-            log.warning(f'unsupported file type "{type(url)}".')
-            return
+        self.append_media(await self.upload(url, file_type), file_type)
 
-        if url.startswith('http'):
-            res = await self.api.upload_file(
-                self.chain.data.user_openid if self.chain.data.is_direct else self.chain.data.channel_openid,
-                file_type,
-                url,
-                is_direct=self.chain.data.is_direct,
-            )
-            if res:
-                if 'file_info' in res.json:
-                    if file_type != 1:
-                        self.refresh_payload()
+    def append_media(self, file_info: Optional[str], file_type: int = 1):
+        if file_info:
+            if file_type != 1:
+                self.refresh_payload()
 
-                    file_info = res.json['file_info']
+            self.payload.msg_type = 7
+            self.payload.media = {'file_info': file_info}
 
-                    self.payload.msg_type = 7
-                    self.payload.media = {'file_info': file_info}
+            self.refresh_payload()
 
-                    self.refresh_payload()
-                else:
-                    log.warning('file upload fail.')
+    async def upload(self, url: str, file_type: int = 1) -> Optional[str]:
+        if not isinstance(url, str):
+            log.warning(f'unsupported file type "{type(url)}".')
+            return None
 
+        if not url.startswith('http'):
+            log.warning(f'media file must be network paths.')
+            return None
+
+        try:
+            return await self.upload_media(url, file_type)
+        finally:
             if isinstance(self.chain.builder, QQGroupChainBuilder):
                 self.chain.builder.remove_file(url)
-        else:
-            log.warning(f'media file must be network paths.')
 
-    async def build(self):
-        for item in self.chain_list:
-            # Text
-            if isinstance(item, Text):
-                self.payload.content += item.content
+    async def upload_media(self, url: str, file_type: int) -> Optional[str]:
+        data = self.chain.data
+        openid = data.user_openid if data.is_direct else data.channel_openid
+
+        cache_key = None
+        if self.upload_cache is not None and isinstance(self.chain.builder, QQGroupChainBuilder):
+            content_hash = self.chain.builder.content_hash(url)
+            if content_hash:
+                cache_key = (openid, file_type, content_hash)
 
-            # Image
-            if isinstance(item, Image):
-                await self.insert_media(await item.get())
+                file_info = self.upload_cache.get(cache_key)
+                if file_info:
+                    return file_info
 
-            # Voice
-            if isinstance(item, Voice):
-                await self.insert_media(await item.get(), 3)
+        res = await self.api.upload_file(openid, file_type, url, is_direct=data.is_direct)
+        if res:
+            if 'file_info' in res.json:
+                file_info = res.json['file_info']
 
-            # Video
-            if isinstance(item, Video):
-                await self.insert_media(await item.get(), 2)
+                if cache_key:
+                    self.upload_cache.set_file_info(cache_key, file_info, int(res.json.get('ttl') or 0))
 
-            # Html
+                return file_info
+
+            log.warning('file upload fail.')
+
+    async def prepare_media(self, item: CHAIN_ITEM, file_type: int, semaphore: asyncio.Semaphore):
+        async with semaphore:
             if isinstance(item, Html):
-                await self.insert_media(await item.create_html_image())
+                url = await item.create_html_image()
+            else:
+                url = await item.get()
+
+            return await self.upload(url, file_type)
+
+    async def build(self):
+        # 先并发渲染并上传所有媒体，再按消息链顺序组装，保证 msg_seq 的顺序
+        semaphore = asyncio.Semaphore(self.concurrency)
+        media_tasks: Dict[int, asyncio.Task] = {}
+
+        for index, item in enumerate(self.chain_list):
+            file_type = media_file_type(item)
+            if file_type:
+                media_tasks[index] = asyncio.create_task(self.prepare_media(item, file_type, semaphore))
+
+        try:
+            return await self.assemble(media_tasks)
+        finally:
+            for task in media_tasks.values():
+                task.cancel()
+
+    async def assemble(self, media_tasks: Dict[int, asyncio.Task]):
+        for index, item in enumerate(self.chain_list):
+            # Text
+            if isinstance(item, Text):
+                self.payload.content += item.content
+
+            # Image, Voice, Video, Html
+            if index in media_tasks:
+                self.append_media(await media_tasks[index], media_file_type(item))
 
             # Ark
             if isinstance(item, Ark):
@@ -249,5 +364,10 @@ class PayloadBuilder:
         return [asdict(item) for item in self.payload_list]
 
 
-async def build_message_send(api: QQGroupAPI, chain: Chain, seq_service: SeqService):
-    return await PayloadBuilder(api, chain, seq_service).build()
+async def build_message_send(
+    api: QQGroupAPI,
+    chain: Chain,
+    seq_service: SeqService,
+    upload_cache: Optional[UploadCache] = None,
+):
+    return await PayloadBuilder(api, chain, seq_service, upload_cache).build()
@@ -1,22 +1,33 @@
+import asyncio
+
+from typing import List
 from playwright.async_api import async_playwright, ConsoleMessage, Error as PageError
 
 from .launchConfig import *
 from .pagePool import *
 from .pageContext import PageContext
+from .browserProcess import BrowserProcess
 
 
 class BrowserService:
     def __init__(self):
         self.playwright: Optional[Playwright] = None
-        self.browser: Optional[Union[Browser, BrowserContext]] = None
         self.config: Optional[BrowserLaunchConfig] = None
-        self.pool: Optional[PagePool] = None
+        self.processes: List[BrowserProcess] = []
 
         self.launched = False
 
     def __str__(self):
         return self.config.name if self.config else 'Not Launched'
 
+    @property
+    def browser(self) -> Optional[Union[Browser, BrowserContext]]:
+        return self.processes[0].browser if self.processes else None
+
+    @property
+    def pool(self) -> Optional[PagePool]:
+        return self.processes[0].pool if self.processes else None
+
     async def launch(self, config: BrowserLaunchConfig):
         if self.launched:
             return None
@@ -26,39 +37,50 @@ class BrowserService:
         log.info('launching browser...')
 
         self.playwright = await async_playwright().start()
-        self.browser = await config.launch_browser(self.playwright)
         self.config = config
+        self.processes = [
+            BrowserProcess(index, self.playwright, config) for index in range(max(config.browser_count, 1))
+        ]
 
-        if self.config.page_pool_size:
-            self.pool = PagePool(self.browser, config)
+        await asyncio.gather(*(item.launch() for item in self.processes))
 
         # if not config.browser_name:
         #     config.browser_name = self.browser._impl_obj._browser_type.name
 
-        log.info(f'{self} launched successful.')
+        log.info(f'{self} launched successful. processes: {len(self.processes)}')
 
     async def close(self):
-        await self.browser.close()
+        for item in self.processes:
+            await item.close()
+
         await self.playwright.stop()
 
         log.info(f'{self} closed.')
 
-    async def open_page(self, width: int, height: int):
-        if self.browser:
+    def stat(self):
+        return [item.stat() for item in self.processes]
+
+    async def open_page(self, width: int, height: int, template: Optional[str] = None):
+        processes = [item for item in self.processes if item.alive]
+        if processes:
             size = ViewportSize(width=width, height=height)
 
-            if self.pool:
-                page_context = await self.pool.acquire_page(size)
-            else:
-                page_context = PageContext(
-                    await self.browser.new_page(no_viewport=True, viewport=size),
-                )
+            # 分配到负载最低的浏览器进程
+            process = min(processes, key=lambda item: item.load)
+            page_context = await process.open_page(size, template)
 
             if self.config.debug:
                 page_context.page.once('console', self.__console)
                 page_context.page.once('pageerror', self.__page_error)
 
-            hook_res = await self.config.on_page_created(page_context.page)
+            try:
+                hook_res = await self.config.on_page_created(page_context.page)
+            except BaseException:
+                # 钩子失败时归还页面，页面状态不确定，不再作为模板热页面复用
+                page_context.template = None
+                await page_context.release()
+                raise
+
             if hook_res:
                 page_context.page = hook_res
 
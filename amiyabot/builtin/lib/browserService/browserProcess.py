@@ -0,0 +1,119 @@
+import asyncio
+
+from playwright.async_api import ViewportSize
+
+from .launchConfig import *
+from .pagePool import PagePool
+from .pageContext import PageContext
+from .metrics import BrowserMetrics
+
+
+class BrowserProcess:
+    def __init__(self, index: int, playwright: Playwright, config: BrowserLaunchConfig):
+        self.index = index
+        self.playwright = playwright
+        self.config = config
+
+        self.browser: Optional[Union[Browser, BrowserContext]] = None
+        self.pool: Optional[PagePool] = None
+
+        self.metrics = BrowserMetrics()
+
+        self.closing = False
+        self.relaunching = False
+
+    def __str__(self):
+        return f'{self.config.name}#{self.index}'
+
+    @property
+    def alive(self):
+        return bool(self.browser) and not self.relaunching and not self.closing
+
+    @property
+    def load(self):
+        return self.metrics.pages_in_use
+
+    async def launch(self):
+        self.browser = await self.config.launch_browser(self.playwright)
+        self.browser.on('disconnected' if isinstance(self.browser, Browser) else 'close', self.__on_disconnected)
+
+        if self.config.page_pool_size:
+            self.pool = PagePool(self.browser, self.config, name=str(self))
+            self.pool.start()
+
+        self.metrics.launches += 1
+
+    async def relaunch(self):
+        if self.relaunching or self.closing:
+            return None
+
+        self.relaunching = True
+
+        try:
+            if self.pool:
+                await self.pool.close()
+                self.pool = None
+
+            self.browser = None
+
+            while not self.closing:
+                try:
+                    await self.launch()
+                    log.info(f'{self} relaunched.')
+                    break
+                except Exception as e:
+                    log.error(e, desc=f'{self} relaunch error:')
+                    await asyncio.sleep(5)
+        finally:
+            self.relaunching = False
+
+    async def close(self):
+        self.closing = True
+
+        if self.pool:
+            await self.pool.close()
+
+        if self.browser:
+            await self.browser.close()
+
+    async def open_page(self, size: ViewportSize, template: Optional[str] = None):
+        self.metrics.pages_in_use += 1
+
+        try:
+            if self.pool:
+                page_context = await self.pool.acquire_page(size, template)
+            else:
+                page_context = PageContext(
+                    await self.browser.new_page(**self.config.page_options(size)),
+                )
+        except BaseException:
+            self.metrics.pages_in_use -= 1
+            raise
+
+        page_context.on_exit = self.__on_page_exit
+        self.metrics.pages_opened += 1
+
+        return page_context
+
+    def stat(self):
+        return {
+            'name': str(self),
+            'alive': self.alive,
+            **self.metrics.dict(),
+            'pool': self.pool.stat() if self.pool else None,
+        }
+
+    def __on_page_exit(self):
+        self.metrics.pages_in_use -= 1
+
+    def __on_disconnected(self, *args):
+        if self.closing:
+            return None
+
+        self.metrics.crashes += 1
+        log.warning(f'{self} disconnected.')
+
+        if self.config.relaunch_on_crash:
+            asyncio.create_task(self.relaunch())
+        else:
+            self.browser = None
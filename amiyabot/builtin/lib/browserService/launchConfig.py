@@ -1,5 +1,7 @@
+import sys
+
 from typing import Union, Optional
-from playwright.async_api import Browser, BrowserType, BrowserContext, Page, Playwright
+from playwright.async_api import Browser, BrowserType, BrowserContext, Page, Playwright, ViewportSize
 from amiyautils import argv
 from amiyalog import LoggerManager
 
@@ -7,7 +9,17 @@ DEFAULT_WIDTH = argv('browser-width', int) or 1280
 DEFAULT_HEIGHT = argv('browser-height', int) or 720
 DEFAULT_RENDER_TIME = argv('browser-render-time', int) or 200
 BROWSER_PAGE_POOL_SIZE = argv('browser-page-pool-size', int) or 0
+BROWSER_PAGE_POOL_MIN_SIZE = argv('browser-page-pool-min-size', int) or 0
+BROWSER_PAGE_POOL_IDLE_TIMEOUT = argv('browser-page-pool-idle-timeout', int) or 300
+# 为 0 时不限制等待时间，因此只在未传入该参数时使用默认值
+BROWSER_PAGE_POOL_ACQUIRE_TIMEOUT = (
+    argv('browser-page-pool-acquire-timeout', int) if '--browser-page-pool-acquire-timeout' in sys.argv else 60
+)
+BROWSER_PAGE_POOL_HEALTH_CHECK_INTERVAL = argv('browser-page-pool-health-check-interval', int) or 30
+BROWSER_PAGE_TEMPLATE_AFFINITY = argv('browser-page-template-affinity', bool)
 BROWSER_LAUNCH_WITH_HEADED = argv('browser-launch-with-headed', bool)
+BROWSER_COUNT = argv('browser-count', int) or 1
+BROWSER_DEVICE_SCALE_FACTOR = argv('browser-device-scale-factor', float) or None
 
 log = LoggerManager('Browser')
 
@@ -16,13 +28,42 @@ class BrowserLaunchConfig:
     def __init__(self):
         self.browser_type: str = 'chromium'
         self.browser_name: [Optional] = None
+        # 启动的浏览器进程数，页面会分配到负载最低的浏览器上
+        self.browser_count: int = BROWSER_COUNT
+        # 浏览器进程崩溃或断开后自动重启
+        self.relaunch_on_crash: bool = True
         self.page_pool_size: int = BROWSER_PAGE_POOL_SIZE
+        # 页面池弹性伸缩：空闲超过 idle_timeout 秒的页面会被关闭，但至少保留 min_size 个页面
+        self.page_pool_min_size: int = BROWSER_PAGE_POOL_MIN_SIZE
+        self.page_pool_idle_timeout: int = BROWSER_PAGE_POOL_IDLE_TIMEOUT
+        # 获取页面的最长等待时间（秒），为 0 时不限制
+        self.page_pool_acquire_timeout: int = BROWSER_PAGE_POOL_ACQUIRE_TIMEOUT
+        # 空闲页面的健康检查间隔（秒）
+        self.page_pool_health_check_interval: int = BROWSER_PAGE_POOL_HEALTH_CHECK_INTERVAL
+        # 页面池模板亲和模式：归还的页面保留在模板上，再次渲染同一模板时仅重新执行 init(data)
+        self.page_template_affinity: bool = BROWSER_PAGE_TEMPLATE_AFFINITY
+        # 页面的设备像素比，设置后截图的分辨率会按此倍数放大
+        self.device_scale_factor: Optional[float] = BROWSER_DEVICE_SCALE_FACTOR
         self.debug: bool = argv('debug', bool)
 
     @property
     def name(self):
         return f'browser({self.browser_name or self.browser_type})'
 
+    def page_options(self, viewport: Optional[ViewportSize] = None) -> dict:
+        if self.device_scale_factor:
+            # 设备像素比不能与 no_viewport 同时使用，此时需要给定一个初始视口
+            return {
+                'viewport': viewport or ViewportSize(width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT),
+                'device_scale_factor': self.device_scale_factor,
+            }
+
+        options = {'no_viewport': True}
+        if viewport:
+            options['viewport'] = viewport
+
+        return options
+
     async def launch_browser(self, playwright: Playwright) -> Union[Browser, BrowserContext]:
         browser: BrowserType = getattr(playwright, self.browser_type)
 
@@ -0,0 +1,37 @@
+from dataclasses import dataclass, field
+from amiyabot.builtin.lib.histogram import Histogram
+
+
+@dataclass
+class PagePoolMetrics:
+    # 获取页面的等待时间（毫秒）
+    acquire_wait: Histogram = field(default_factory=Histogram)
+    acquire_timeouts: int = 0
+    created: int = 0
+    evicted: int = 0
+    unhealthy: int = 0
+
+    def dict(self):
+        return {
+            'acquire_wait': self.acquire_wait.dict(),
+            'acquire_timeouts': self.acquire_timeouts,
+            'created': self.created,
+            'evicted': self.evicted,
+            'unhealthy': self.unhealthy,
+        }
+
+
+@dataclass
+class BrowserMetrics:
+    launches: int = 0
+    crashes: int = 0
+    pages_opened: int = 0
+    pages_in_use: int = 0
+
+    def dict(self):
+        return {
+            'launches': self.launches,
+            'crashes': self.crashes,
+            'pages_opened': self.pages_opened,
+            'pages_in_use': self.pages_in_use,
+        }
@@ -1,3 +1,4 @@
+from typing import Optional, Callable
 from playwright.async_api import Page
 
 
@@ -5,8 +6,24 @@ class PageContext:
     def __init__(self, page: Page):
         self.page = page
 
+        # 页面当前所属的模板，以及是否已停留在该模板上（仅页面池模板亲和模式下可能为 True）
+        self.template: Optional[str] = None
+        self.template_ready = False
+
+        self.on_exit: Optional[Callable[[], None]] = None
+
     async def __aenter__(self):
         return self.page
 
     async def __aexit__(self, *args, **kwargs):
+        await self.release()
+
+    async def release(self):
+        try:
+            await self.close_page()
+        finally:
+            if self.on_exit:
+                self.on_exit()
+
+    async def close_page(self):
         await self.page.close()
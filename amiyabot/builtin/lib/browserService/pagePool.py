@@ -1,92 +1,323 @@
+import time
 import asyncio
 
+from typing import Dict, Deque
+from collections import deque
 from playwright.async_api import ViewportSize
 from contextlib import asynccontextmanager
 
 from .launchConfig import *
 from .pageContext import PageContext
+from .metrics import PagePoolMetrics
+
+
+class PagePoolClosedError(Exception):
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self):
+        return f'{self.name} -- page pool is closed'
 
 
 class PagePool:
-    def __init__(self, browser: Union[Browser, BrowserContext], config: BrowserLaunchConfig):
+    def __init__(self, browser: Union[Browser, BrowserContext], config: BrowserLaunchConfig, name: str = ''):
+        self.name = name or config.name
         self.config = config
         self.browser = browser
 
         self.size = 0
         self.queuing_num = 0
 
-        self.lock = asyncio.Lock()
-        self.queue = asyncio.Queue()
+        self.idle_pages: Deque[Page] = deque()
+        self.idle_since: Dict[Page, float] = {}
+        self.templates: Dict[Page, str] = {}
+        self.condition = asyncio.Condition()
+
+        self.metrics = PagePoolMetrics()
+        self.maintain_task: Optional[asyncio.Task] = None
+
+        self.closed = False
 
     @property
     def max_size(self):
         return self.config.page_pool_size
 
+    @property
+    def min_size(self):
+        return min(self.config.page_pool_min_size, self.max_size)
+
     @property
     def queue_size(self):
-        return self.queue.qsize()
+        return len(self.idle_pages)
+
+    @property
+    def template_affinity(self):
+        return self.config.page_template_affinity
+
+    def start(self):
+        if not self.maintain_task:
+            self.maintain_task = asyncio.create_task(self.__maintain())
+
+    async def close(self):
+        if self.maintain_task:
+            self.maintain_task.cancel()
+            self.maintain_task = None
+
+        async with self.condition:
+            self.closed = True
+
+            pages = list(self.idle_pages)
+            self.idle_pages.clear()
+            self.idle_since.clear()
+            self.templates.clear()
+            self.size -= len(pages)
+
+            # 唤醒所有等待中的请求，使其立即失败而不是等待到超时
+            self.condition.notify_all()
+
+        for page in pages:
+            await self.__close_page(page)
+
+    def stat(self):
+        return {
+            'size': self.size,
+            'idle': self.queue_size,
+            'queuing': self.queuing_num,
+            **self.metrics.dict(),
+        }
 
     @asynccontextmanager
     async def __queuing(self):
         self.queuing_num += 1
-        yield
-        self.queuing_num -= 1
+        try:
+            yield
+        finally:
+            self.queuing_num -= 1
 
-    async def acquire_page(self, viewport_size: ViewportSize):
-        log.debug(
-            f'{self.config.name} -- idle pages: {self.queue_size} opened: {self.size} queuing: {self.queuing_num}'
-        )
+    def __take_idle_page(self, template: Optional[str] = None):
+        if not self.idle_pages:
+            return None
 
-        created = False
+        page = None
 
-        if self.queue_size == 0:
-            async with self.lock:
-                if self.size < self.max_size:
-                    if isinstance(self.browser, BrowserContext):
-                        page = await self.browser.new_page()
-                    else:
-                        context = await self.browser.new_context(no_viewport=True)
-                        hook_res = await self.config.on_context_created(context)
-                        if hook_res:
-                            context = hook_res
+        if self.template_affinity and template:
+            for item in self.idle_pages:
+                if self.templates.get(item) == template:
+                    page = item
+                    break
+
+        if page is None:
+            # 优先取出没有停留在模板上的页面，尽量保留其他模板的热页面
+            for item in self.idle_pages:
+                if item not in self.templates:
+                    page = item
+                    break
+
+        if page is None:
+            page = self.idle_pages[0]
+            del self.templates[page]
+
+        self.idle_pages.remove(page)
+        del self.idle_since[page]
+
+        return page
+
+    def __put_idle_page(self, page: Page):
+        self.idle_pages.append(page)
+        self.idle_since[page] = time.monotonic()
+        self.condition.notify()
+
+    def __remove_idle_page(self, page: Page):
+        if page not in self.idle_since:
+            return False
+
+        self.idle_pages.remove(page)
+        self.templates.pop(page, None)
+        del self.idle_since[page]
+        self.size -= 1
+        self.condition.notify()
+
+        return True
+
+    async def __create_page(self):
+        if isinstance(self.browser, BrowserContext):
+            page = await self.browser.new_page()
+        else:
+            context = await self.browser.new_context(**self.config.page_options())
+            hook_res = await self.config.on_context_created(context)
+            if hook_res:
+                context = hook_res
+
+            page = await context.new_page()
+
+        self.metrics.created += 1
+
+        log.debug(f'{self.name} -- page created. curr size: {self.size}/{self.max_size}')
 
-                        page = await context.new_page()
+        return page
 
-                    created = True
+    async def __close_page(self, page: Page):
+        try:
+            if isinstance(self.browser, BrowserContext):
+                await page.close()
+            else:
+                await page.context.close()
+        except Exception as e:
+            log.debug(f'{self.name} -- {repr(e)}')
+
+    async def __checkout(self, template: Optional[str] = None):
+        async with self.condition:
+            while True:
+                if self.closed:
+                    raise PagePoolClosedError(self.name)
+
+                page = self.__take_idle_page(template)
+                if page:
+                    return page
+
+                if self.size < self.max_size:
                     self.size += 1
+                    break
 
-                    log.debug(f'{self.config.name} -- page created. curr size: {self.size}/{self.max_size}')
+                async with self.__queuing():
+                    await self.condition.wait()
+
+        try:
+            return await self.__create_page()
+        except BaseException:
+            await self.__discard_page()
+            raise
 
-        if not created:
-            async with self.__queuing():
-                page: Page = await self.queue.get()
+    async def acquire_page(self, viewport_size: ViewportSize, template: Optional[str] = None):
+        log.debug(f'{self.name} -- idle pages: {self.queue_size} opened: {self.size} queuing: {self.queuing_num}')
+
+        begin = time.monotonic()
+        try:
+            page = await asyncio.wait_for(
+                self.__checkout(template),
+                timeout=self.config.page_pool_acquire_timeout or None,
+            )
+        except asyncio.TimeoutError:
+            self.metrics.acquire_timeouts += 1
+            log.warning(
+                f'{self.name} -- acquire page timeout after {self.config.page_pool_acquire_timeout}s. '
+                f'opened: {self.size} queuing: {self.queuing_num}'
+            )
+            raise
+        finally:
+            self.metrics.acquire_wait.observe((time.monotonic() - begin) * 1000)
 
         try:
             await page.set_viewport_size(viewport_size)
         except Exception as e:
-            log.warning(f'{self.config.name} -- {repr(e)}')
+            log.warning(f'{self.name} -- {repr(e)}')
             if 'context or browser has been closed' in str(e):
-                self.size -= 1
-                return await self.acquire_page(viewport_size)
+                self.templates.pop(page, None)
+                await self.__discard_page()
+                await self.__close_page(page)
+                return await self.acquire_page(viewport_size, template)
 
-        return PagePoolContext(page, self)
+        context = PagePoolContext(page, self)
+        context.template = template
+        context.template_ready = bool(template) and self.templates.pop(page, None) == template
+
+        return context
+
+    async def release_page(self, page: Page, template: Optional[str] = None):
+        if self.closed:
+            await self.__discard_page()
+            await self.__close_page(page)
+            return None
 
-    async def release_page(self, page: Page):
         try:
-            await page.context.clear_cookies()
-            await page.evaluate(
-                '''
-                localStorage.clear();
-                sessionStorage.clear();
-                '''
-            )
-            await page.goto('about:blank')
-            await self.queue.put(page)
+            if self.template_affinity and template:
+                # 模板页面不做重置，下次渲染同一模板时直接执行 init(data)
+                self.templates[page] = template
+            else:
+                await page.context.clear_cookies()
+                await page.evaluate(
+                    '''
+                    localStorage.clear();
+                    sessionStorage.clear();
+                    '''
+                )
+                await page.goto('about:blank')
+
+            async with self.condition:
+                if self.closed:
+                    raise PagePoolClosedError(self.name)
+
+                self.__put_idle_page(page)
         except Exception as e:
-            log.warning(f'{self.config.name} -- {repr(e)}')
+            log.warning(f'{self.name} -- {repr(e)}')
+            self.templates.pop(page, None)
+            await self.__discard_page()
+            await self.__close_page(page)
+
+        log.debug(f'{self.name} -- page released. idle pages: {self.queue_size}')
+
+    async def __discard_page(self):
+        async with self.condition:
             self.size -= 1
+            self.condition.notify()
+
+    async def __maintain(self):
+        while True:
+            await asyncio.sleep(self.config.page_pool_health_check_interval)
+
+            async with log.catch(f'{self.name} -- page pool maintain error:'):
+                await self.evict_idle_pages()
+                await self.check_idle_pages()
+                await self.fill_min_pages()
+
+    async def evict_idle_pages(self):
+        now = time.monotonic()
+        evicted = []
+
+        async with self.condition:
+            for page in list(self.idle_pages):
+                if self.size <= self.min_size:
+                    break
+                if now - self.idle_since[page] >= self.config.page_pool_idle_timeout:
+                    self.__remove_idle_page(page)
+                    evicted.append(page)
+
+        for page in evicted:
+            await self.__close_page(page)
+
+        if evicted:
+            self.metrics.evicted += len(evicted)
+            log.debug(f'{self.name} -- {len(evicted)} idle pages evicted. curr size: {self.size}')
+
+    async def check_idle_pages(self):
+        for page in list(self.idle_pages):
+            try:
+                await asyncio.wait_for(page.evaluate('1'), timeout=5)
+            except Exception as e:
+                async with self.condition:
+                    removed = self.__remove_idle_page(page)
+
+                if removed:
+                    self.metrics.unhealthy += 1
+                    log.warning(f'{self.name} -- unhealthy page removed: {repr(e)}')
+
+                    await self.__close_page(page)
+
+    async def fill_min_pages(self):
+        while True:
+            async with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+
+            try:
+                page = await self.__create_page()
+            except Exception:
+                await self.__discard_page()
+                raise
 
-        log.debug(f'{self.config.name} -- page released. idle pages: {self.queue_size}')
+            async with self.condition:
+                self.__put_idle_page(page)
 
 
 class PagePoolContext(PageContext):
@@ -94,5 +325,5 @@ class PagePoolContext(PageContext):
         super().__init__(page)
         self.pool = pool
 
-    async def __aexit__(self, *args, **kwargs):
-        await self.pool.release_page(self.page)
+    async def close_page(self):
+        await self.pool.release_page(self.page, self.template)
@@ -0,0 +1,26 @@
+import os
+import hashlib
+
+from amiyautils import random_code
+
+
+def hash_file(path: str):
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def read_file(path: str):
+    with open(path, mode='rb') as f:
+        return f.read()
+
+
+def write_file_atomic(content: bytes, path: str):
+    # 先写入临时文件再替换，读取方不会读到写了一半的文件
+    temp = f'{path}.{random_code(6)}.tmp'
+    with open(temp, mode='wb') as f:
+        f.write(content)
+    os.replace(temp, path)
@@ -0,0 +1,251 @@
+import os
+import re
+import abc
+import time
+import shutil
+import asyncio
+import hashlib
+import mimetypes
+
+from typing import Any, Dict, List, Callable, Optional
+from functools import partial
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from amiyautils import create_dir
+from amiyalog import logger as log
+from amiyabot.builtin.lib.fileUtils import hash_file, read_file, write_file_atomic
+
+# 存储中的文件均以内容哈希命名，只有符合该格式的文件才会被接管和清理
+MEDIA_FILENAME = re.compile(r'^[0-9a-f]{64}\.\w+$')
+
+
+@dataclass
+class MediaFile:
+    filename: str
+    size: int
+    last_used: float
+    refs: int = 0
+    content: Optional[bytes] = None
+
+    @property
+    def content_type(self):
+        return mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+
+
+def _scan_files(path: str):
+    files = []
+    for entry in os.scandir(path):
+        if entry.is_file() and MEDIA_FILENAME.match(entry.name):
+            stat = entry.stat()
+            files.append(MediaFile(entry.name, stat.st_size, stat.st_mtime))
+
+    return files
+
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class MediaStore(abc.ABC):
+    def __init__(self, max_age: int, max_size: int, clean_interval: int, ref_ttl: int):
+        """
+        以内容哈希命名的媒体文件存储，相同内容只会保存一份
+
+        :param max_age:        未被引用的文件在最后一次使用后的保留时间（秒）
+        :param max_size:       存储的最大总大小（字节），超出时优先清理最久未使用的文件
+        :param clean_interval: 清理任务的执行间隔（秒）
+        :param ref_ttl:        被引用的文件在最后一次使用后超过该时间（秒）仍未释放时，视为引用已泄漏并清除其引用
+        """
+        self.max_age = max_age
+        self.max_size = max_size
+        self.clean_interval = clean_interval
+        self.ref_ttl = ref_ttl
+
+        self.files: Dict[str, MediaFile] = {}
+        self.total_size = 0
+
+        self.busy: Dict[str, asyncio.Future] = {}
+        self.janitor: Optional[asyncio.Task] = None
+
+    def start(self):
+        if not self.janitor:
+            self.janitor = asyncio.create_task(self.run_janitor())
+
+    async def stop(self):
+        if self.janitor:
+            self.janitor.cancel()
+            self.janitor = None
+
+    def get(self, filename: str) -> Optional[MediaFile]:
+        item = self.files.get(filename)
+        if item:
+            item.last_used = time.time()
+
+        return item
+
+    def release(self, filename: str):
+        if filename in self.files:
+            item = self.files[filename]
+            item.refs = max(item.refs - 1, 0)
+            item.last_used = time.time()
+
+    async def save(self, content: bytes, suffix: str) -> str:
+        filename = f'{hashlib.sha256(content).hexdigest()}.{suffix}'
+
+        return await self.store(filename, partial(self.write, content))
+
+    async def save_file(self, src: str, suffix: str) -> str:
+        filename = f'{await asyncio.to_thread(hash_file, src)}.{suffix}'
+
+        return await self.store(filename, partial(self.write_file, src))
+
+    @abc.abstractmethod
+    async def write(self, content: bytes, filename: str) -> MediaFile:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def write_file(self, src: str, filename: str) -> MediaFile:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def remove(self, item: MediaFile):
+        raise NotImplementedError
+
+    async def store(self, filename: str, writer: Callable[[str], Any]) -> str:
+        # 同一文件正在写入或删除时，等待其完成
+        while filename in self.busy:
+            await asyncio.wait([self.busy[filename]])
+
+        if filename not in self.files:
+            async with self.__busy(filename):
+                item: MediaFile = await writer(filename)
+
+            self.files[filename] = item
+            self.total_size += item.size
+
+        item = self.files[filename]
+        item.refs += 1
+        item.last_used = time.time()
+
+        return filename
+
+    @asynccontextmanager
+    async def __busy(self, filename: str):
+        future = asyncio.get_running_loop().create_future()
+        self.busy[filename] = future
+        try:
+            yield
+        finally:
+            del self.busy[filename]
+            future.set_result(None)
+
+    async def run_janitor(self):
+        while True:
+            async with log.catch('media store clean error:'):
+                await self.clean()
+            await asyncio.sleep(self.clean_interval)
+
+    async def clean(self):
+        now = time.time()
+
+        # 保存后未能送达发送流程的文件不会被释放，超过 ref_ttl 后不再视为被引用
+        for item in self.files.values():
+            if item.refs and now - item.last_used >= self.ref_ttl:
+                log.warning(f'media file {item.filename} still has {item.refs} refs after {self.ref_ttl}s, released.')
+                item.refs = 0
+
+        removable = sorted(
+            (item for item in self.files.values() if not item.refs),
+            key=lambda item: item.last_used,
+        )
+
+        expired: List[MediaFile] = []
+        total_size = self.total_size
+
+        for item in removable:
+            if now - item.last_used >= self.max_age or total_size > self.max_size:
+                expired.append(item)
+                total_size -= item.size
+
+        for item in expired:
+            if self.files.get(item.filename) is not item or item.refs:
+                continue
+
+            del self.files[item.filename]
+            self.total_size -= item.size
+
+            async with self.__busy(item.filename):
+                await self.remove(item)
+
+        if expired:
+            log.debug(f'media store cleaned {len(expired)} files. total size: {self.total_size}')
+
+
+class DiskMediaStore(MediaStore):
+    def __init__(
+        self,
+        path: str,
+        max_age: int = 600,
+        max_size: int = 512 * 1024 * 1024,
+        clean_interval: int = 60,
+        ref_ttl: int = 3600,
+    ):
+        """
+        保存在磁盘目录中的媒体文件存储，文件读写均在线程池中进行
+
+        :param path: 存储目录
+        """
+        super().__init__(max_age, max_size, clean_interval, ref_ttl)
+
+        create_dir(path)
+
+        self.path = path
+
+    def file_path(self, filename: str):
+        return os.path.join(self.path, filename)
+
+    async def write(self, content: bytes, filename: str):
+        await asyncio.to_thread(write_file_atomic, content, self.file_path(filename))
+        return MediaFile(filename, len(content), time.time())
+
+    async def write_file(self, src: str, filename: str):
+        await asyncio.to_thread(shutil.copyfile, src, self.file_path(filename))
+        return MediaFile(filename, os.path.getsize(src), time.time())
+
+    async def remove(self, item: MediaFile):
+        await asyncio.to_thread(_remove_file, self.file_path(item.filename))
+
+    async def run_janitor(self):
+        # 接管上次运行遗留的文件，使其可以被复用或清理
+        async with log.catch('media store load error:'):
+            for item in await asyncio.to_thread(_scan_files, self.path):
+                if item.filename not in self.files and item.filename not in self.busy:
+                    self.files[item.filename] = item
+                    self.total_size += item.size
+
+        await super().run_janitor()
+
+
+class MemoryMediaStore(MediaStore):
+    def __init__(
+        self,
+        max_age: int = 600,
+        max_size: int = 256 * 1024 * 1024,
+        clean_interval: int = 60,
+        ref_ttl: int = 3600,
+    ):
+        """
+        保存在内存中的媒体文件存储，文件内容通过 get 方法取出后直接对外提供
+        """
+        super().__init__(max_age, max_size, clean_interval, ref_ttl)
+
+    async def write(self, content: bytes, filename: str):
+        return MediaFile(filename, len(content), time.time(), content=content)
+
+    async def write_file(self, src: str, filename: str):
+        content = await asyncio.to_thread(read_file, src)
+        return MediaFile(filename, len(content), time.time(), content=content)
+
+    async def remove(self, item: MediaFile):
+        item.content = None
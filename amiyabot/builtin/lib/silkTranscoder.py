@@ -0,0 +1,104 @@
+import os
+import asyncio
+
+from typing import Dict
+from graiax import silkcoder
+from amiyautils import create_dir
+from amiyalog import logger as log
+from amiyabot.builtin.lib.fileUtils import hash_file, read_file, write_file_atomic
+
+
+def _scan_voices(path: str, suffixes: tuple):
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            if name.lower().endswith(suffixes):
+                files.append(os.path.join(root, name))
+
+    return files
+
+
+class SilkTranscoder:
+    def __init__(self, cache_path: str = './cache/silk', concurrency: int = 2):
+        """
+        silk 语音转码服务，转码结果以源文件的内容哈希为键缓存在磁盘中
+
+        :param cache_path:  缓存目录，为空时不缓存，不应放在对外提供静态文件的目录（如 ./resource）中
+        :param concurrency: 同时进行的转码任务数
+        """
+        self.cache_path = cache_path
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+        self.encoding: Dict[str, asyncio.Future] = {}
+
+    def set_concurrency(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    def cache_file(self, key: str):
+        return os.path.join(self.cache_path, f'{key}.silk')
+
+    async def encode(self, path: str, ios_adaptive: bool = True) -> bytes:
+        key = await asyncio.to_thread(hash_file, path)
+        if ios_adaptive:
+            key += '-ios'
+
+        if self.cache_path and os.path.exists(self.cache_file(key)):
+            content = await asyncio.to_thread(read_file, self.cache_file(key))
+            if content:
+                return content
+
+        # 相同的源文件正在转码时，等待其结果
+        if key in self.encoding:
+            return await asyncio.shield(self.encoding[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.encoding[key] = future
+        try:
+            async with self.semaphore:
+                content = await silkcoder.async_encode(path, ios_adaptive=ios_adaptive)
+
+            if self.cache_path:
+                async with log.catch('silk cache write error:'):
+                    create_dir(self.cache_path)
+                    await asyncio.to_thread(write_file_atomic, content, self.cache_file(key))
+
+            future.set_result(content)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self.encoding[key]
+            if future.done() and not future.cancelled():
+                # 没有其他等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+
+        return content
+
+    async def prewarm(
+        self,
+        path: str,
+        suffixes: tuple = ('.mp3', '.wav', '.ogg', '.flac', '.m4a', '.amr'),
+        ios_adaptive: bool = True,
+    ):
+        """
+        预先转码目录中的语音文件并写入缓存，可在启动时以后台任务执行
+
+        :param path:         语音目录
+        :param suffixes:     需要转码的文件后缀
+        :param ios_adaptive: 与发送时的参数保持一致
+        """
+        files = await asyncio.to_thread(_scan_voices, path, suffixes)
+
+        async def encode(file: str):
+            async with log.catch(f'silk prewarm error ({file}):'):
+                await self.encode(file, ios_adaptive)
+
+        await asyncio.gather(*(encode(file) for file in files))
+
+        log.info(f'silk transcoder prewarmed {len(files)} voice files in {path}.')
+
+
+silk_transcoder = SilkTranscoder()
@@ -1,10 +1,16 @@
+import random
 import asyncio
 
-from typing import Optional, Callable
+from typing import Dict, List, Set, Tuple, Optional, Callable
+from datetime import datetime, timedelta
+from functools import wraps
 from dataclasses import dataclass
+from apscheduler.events import EVENT_JOB_REMOVED, JobEvent
+from apscheduler.jobstores.base import JobLookupError
 from amiyabot.signalHandler import SignalHandler
 
-from .scheduler import scheduler
+from .scheduler import scheduler, job_metrics, record_job_error, EXECUTORS, RUN_WHEN_ADDED
+from .processTask import run_in_process, process_task_args
 
 
 @dataclass
@@ -15,43 +21,222 @@ class Task:
     sub_tag: str
     run_when_added: bool
     kwargs: dict
+    # 执行目标：loop（事件循环）、thread（线程池）或 process（进程池）
+    target: str = 'loop'
+
+
+@dataclass
+class TasksOptions:
+    # 循环任务首次执行的随机延迟上限（秒）
+    start_jitter: Optional[int] = None
+    # 使用黄金分割数将相同间隔的循环任务错开执行
+    spread_phase: bool = False
+    # 同一标签（插件）下同时执行的任务数上限
+    tag_concurrency: Optional[int] = None
+
+
+GOLDEN_RATIO = 0.6180339887498949
 
 
 class TasksControl:
+    options = TasksOptions()
+
+    # tag -> sub_tag -> job id
+    jobs: Dict[str, Dict[str, Set[str]]] = {}
+    job_tags: Dict[str, Tuple[str, str]] = {}
+
+    interval_counts: Dict[int, int] = {}
+    tag_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def configure(cls, options: TasksOptions):
+        """
+        设置定时任务的调度选项，仅对之后添加的任务生效
+        """
+        cls.options = options
+
     @classmethod
     def start(cls):
         if not scheduler.state:
             scheduler.start()
             SignalHandler.on_shutdown.append(scheduler.shutdown)
 
+    @classmethod
+    def check_target(cls, target: str):
+        if target not in EXECUTORS:
+            raise ValueError(f'unknown timed task target "{target}", expected one of {list(EXECUTORS)}.')
+
     @classmethod
     def add_timed_task(cls, task: Task):
-        if task.run_when_added:
-            asyncio.create_task(task.func())
+        cls.check_target(task.target)
+
+        job_id = f'{task.tag}.{task.sub_tag}'
+
+        func = task.func
+        kwargs = {**task.kwargs, 'executor': EXECUTORS[task.target]}
+
+        if task.target == 'loop':
+            func = cls.catch_errors(job_id, cls.limit_concurrency(task.tag, func))
+        elif task.target == 'thread':
+            func = cls.catch_errors(job_id, func)
+        else:
+            # 进程任务的异常由调度器的 EVENT_JOB_ERROR 统计
+            kwargs['args'] = process_task_args(func)
+            func = run_in_process
 
         if task.each is not None:
-            scheduler.add_job(
-                task.func,
-                id=f'{task.tag}.{task.sub_tag}',
+            if 'start_date' not in kwargs:
+                start_delay = cls.start_delay(task.each)
+                if start_delay is not None:
+                    kwargs['start_date'] = datetime.now(tz=scheduler.timezone) + timedelta(seconds=start_delay)
+
+            job = scheduler.add_job(
+                func,
+                id=job_id,
                 trigger='interval',
                 seconds=task.each,
-                **task.kwargs,
+                **kwargs,
             )
         else:
+            job = scheduler.add_job(
+                func,
+                id=job_id,
+                **kwargs,
+            )
+
+        if task.run_when_added:
+            # 额外添加一个立即执行的一次性任务，不影响原有的触发时间，执行统计计入原任务
             scheduler.add_job(
-                task.func,
-                id=f'{task.tag}.{task.sub_tag}',
-                **task.kwargs,
+                func,
+                id=job_id + RUN_WHEN_ADDED,
+                trigger='date',
+                run_date=datetime.now(tz=scheduler.timezone),
+                executor=kwargs['executor'],
+                args=kwargs.get('args'),
+                kwargs=kwargs.get('kwargs'),
+                misfire_grace_time=None,
+                replace_existing=True,
             )
 
+        cls.jobs.setdefault(task.tag, {}).setdefault(task.sub_tag, set()).add(job.id)
+        cls.job_tags[job.id] = (task.tag, task.sub_tag)
+
+    @classmethod
+    def start_delay(cls, each: int) -> Optional[float]:
+        options = cls.options
+        if not options.spread_phase and not options.start_jitter:
+            return None
+
+        delay = each
+        if options.spread_phase:
+            # 第 n 个相同间隔的任务从 each * frac(n * φ) 开始，相位在整个间隔内均匀分布
+            index = cls.interval_counts.get(each, 0)
+            cls.interval_counts[each] = index + 1
+
+            delay = each * (((index * GOLDEN_RATIO) % 1) or 1)
+
+        if options.start_jitter:
+            delay += random.uniform(0, options.start_jitter)
+
+        return delay
+
+    @classmethod
+    def limit_concurrency(cls, tag: str, func: Callable):
+        if not cls.options.tag_concurrency:
+            return func
+
+        @wraps(func)
+        async def limited():
+            if tag not in cls.tag_semaphores:
+                cls.tag_semaphores[tag] = asyncio.Semaphore(cls.options.tag_concurrency)
+
+            async with cls.tag_semaphores[tag]:
+                await func()
+
+        return limited
+
+    @classmethod
+    def catch_errors(cls, job_id: str, func: Callable):
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                try:
+                    await func(*args, **kwargs)
+                except Exception as e:
+                    record_job_error(job_id, e)
+
+        else:
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                try:
+                    func(*args, **kwargs)
+                except Exception as e:
+                    record_job_error(job_id, e)
+
+        return wrapper
+
+    @classmethod
+    def list_tasks(cls, tag: str, sub_tag: Optional[str] = None) -> List[str]:
+        """
+        列出标签下的任务 ID
+
+        :param tag:     标签
+        :param sub_tag: 子标签，匹配该子标签及以 "sub_tag." 开头的子标签
+        """
+        sub_tags = cls.jobs.get(tag, {})
+
+        job_ids = []
+        for name, ids in sub_tags.items():
+            if sub_tag is None or name == sub_tag or name.startswith(f'{sub_tag}.'):
+                job_ids += ids
+
+        return job_ids
+
+    @classmethod
+    def stat(cls, tag: Optional[str] = None):
+        """
+        任务的执行耗时、次数、错误及错过执行等统计
+
+        :param tag: 标签，为空时返回全部任务
+        """
+        job_ids = cls.list_tasks(tag) if tag else list(cls.job_tags)
+
+        return {job_id: job_metrics[job_id].dict() for job_id in job_ids if job_id in job_metrics}
+
     @classmethod
     def remove_task(cls, tag: str, sub_tag: Optional[str] = None):
-        for job in scheduler.get_jobs():
-            job_id: str = job.id
-
-            if sub_tag:
-                if job_id.startswith(f'{tag}.{sub_tag}'):
-                    job.remove()
-            else:
-                if job_id.startswith(tag):
-                    job.remove()
+        for job_id in cls.list_tasks(tag, sub_tag):
+            for item in (job_id, job_id + RUN_WHEN_ADDED):
+                try:
+                    scheduler.remove_job(item)
+                except JobLookupError:
+                    pass
+
+            cls.unindex(job_id)
+
+    @classmethod
+    def remove_tasks(cls, tags: List[str]):
+        for tag in tags:
+            cls.remove_task(tag)
+
+    @classmethod
+    def unindex(cls, job_id: str):
+        if job_id not in cls.job_tags:
+            return
+
+        tag, sub_tag = cls.job_tags.pop(job_id)
+
+        ids = cls.jobs[tag][sub_tag]
+        ids.discard(job_id)
+        if not ids:
+            del cls.jobs[tag][sub_tag]
+        if not cls.jobs[tag]:
+            del cls.jobs[tag]
+
+
+@scheduler.event_listener(mask=EVENT_JOB_REMOVED)
+def _(event: JobEvent):
+    # 执行完毕的一次性任务等由调度器移除的任务
+    TasksControl.unindex(event.job_id)
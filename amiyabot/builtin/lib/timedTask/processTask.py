@@ -0,0 +1,57 @@
+import os
+import sys
+import inspect
+
+from typing import Callable, Optional, Tuple
+from importlib import import_module
+
+
+def run_in_process(path: Optional[str], module: str, name: str):
+    """
+    在进程池的子进程中导入任务函数所在的模块并执行任务函数
+
+    :param path:   导入模块前需要加入 sys.path 的目录
+    :param module: 模块名
+    :param name:   模块中的函数名
+    """
+    if path and path not in sys.path:
+        sys.path.insert(0, path)
+
+    return getattr(import_module(module), name)()
+
+
+def process_task_args(func: Callable) -> Tuple[Optional[str], str, str]:
+    """
+    获取子进程中执行任务函数所需的 run_in_process 参数
+
+    插件通过临时的 sys.path 加载，子进程无法直接导入插件模块，因此由 run_in_process 先加入插件所在的目录再导入
+
+    :param func: 模块级的普通函数，不接收参数
+    :return:     (path, module, name)
+    """
+    module, name = func.__module__, func.__qualname__
+
+    if name != func.__name__ or inspect.iscoroutinefunction(func):
+        raise ValueError(f'process timed task "{name}" must be a module-level regular function.')
+
+    try:
+        inspect.signature(func).bind()
+    except TypeError:
+        raise ValueError(f'process timed task "{name}" must not require arguments.') from None
+
+    if module == '__main__':
+        # spawn 的子进程会以 __mp_main__ 的名义重新导入主模块
+        return None, module, name
+
+    file = getattr(sys.modules.get(module), '__file__', None)
+    if not file or not os.path.isfile(file):
+        # 例如以包的形式加载且未解压的插件
+        raise ValueError(f'process timed task "{name}" must be defined in a module file on disk, got "{file}".')
+
+    # 包的 __init__ 文件比普通模块多一层目录
+    depth = module.count('.') + (os.path.splitext(os.path.basename(file))[0] == '__init__')
+    path = os.path.dirname(os.path.abspath(file))
+    for _ in range(depth):
+        path = os.path.dirname(path)
+
+    return path, module, name
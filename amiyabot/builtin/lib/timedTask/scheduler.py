@@ -1,10 +1,35 @@
+import time
+import contextlib
+
+from typing import Dict, Optional
+from dataclasses import dataclass, field
 from amiyalog import LoggerManager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
 from apscheduler.events import *
+from amiyabot.builtin.lib.histogram import Histogram
 
 log = LoggerManager('Schedule')
 
+# 任务执行目标对应的执行器
+EXECUTORS = {
+    'loop': 'default',
+    'thread': 'thread',
+    'process': 'process',
+}
+
+# 线程池及进程池的最大工作数
+POOL_SIZES = {
+    'thread': 8,
+    'process': 2,
+}
+
+RUNTIME_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 30000, 60000, 300000)
+
+# 添加时立即执行的一次性任务的 ID 后缀，其执行统计计入原任务
+RUN_WHEN_ADDED = '.run_when_added'
+
 
 class Scheduler(AsyncIOScheduler):
     options = {
@@ -17,6 +42,17 @@ class Scheduler(AsyncIOScheduler):
         },
     }
 
+    def start(self, paused: bool = False):
+        # 线程池及进程池在调度器启动时才创建，重新启动时替换已关闭的执行器
+        if not self.state:
+            for alias, executor in (('thread', ThreadPoolExecutor), ('process', ProcessPoolExecutor)):
+                with contextlib.suppress(KeyError):
+                    self.remove_executor(alias, shutdown=False)
+
+                self.add_executor(executor(POOL_SIZES[alias]), alias)
+
+        super().start(paused)
+
     def event_listener(self, mask):
         def register(task):
             self.add_listener(task, mask)
@@ -25,8 +61,56 @@ class Scheduler(AsyncIOScheduler):
         return register
 
 
+@dataclass
+class JobMetrics:
+    # 执行耗时（毫秒），从提交到执行器开始计算
+    runtime: Histogram = field(default_factory=lambda: Histogram(RUNTIME_BUCKETS))
+    runs: int = 0
+    errors: int = 0
+    # 错过执行时间（超过 misfire_grace_time）的次数
+    missed: int = 0
+    # 上一次仍在执行而被跳过的次数
+    skipped: int = 0
+
+    def dict(self):
+        return {
+            'runtime': self.runtime.dict(),
+            'runs': self.runs,
+            'errors': self.errors,
+            'missed': self.missed,
+            'skipped': self.skipped,
+        }
+
+
 scheduler = Scheduler(**Scheduler.options)
 
+job_metrics: Dict[str, JobMetrics] = {}
+job_submitted: Dict[str, float] = {}
+
+
+def get_job_metrics(job_id: str) -> Optional[JobMetrics]:
+    job_id = job_id.removesuffix(RUN_WHEN_ADDED)
+
+    # 已移除的任务不再统计，一次性任务的 EVENT_JOB_REMOVED 先于执行完毕的事件
+    if not scheduler.get_job(job_id):
+        return None
+
+    if job_id not in job_metrics:
+        job_metrics[job_id] = JobMetrics()
+
+    return job_metrics[job_id]
+
+
+def record_job_error(job_id: str, error: Exception):
+    """
+    记录在任务内部捕获的异常，这类异常不会触发 EVENT_JOB_ERROR
+    """
+    metrics = get_job_metrics(job_id)
+    if metrics:
+        metrics.errors += 1
+
+    log.error(error, desc='timed task error:')
+
 
 @scheduler.event_listener(mask=EVENT_JOB_ADDED)
 def _(event: JobEvent):
@@ -35,9 +119,44 @@ def _(event: JobEvent):
 
 @scheduler.event_listener(mask=EVENT_JOB_REMOVED)
 def _(event: JobEvent):
+    # 执行中的任务被移除时，job_submitted 在执行完毕的事件中移除
+    job_metrics.pop(event.job_id, None)
     log.debug(f'removed timed task: {event.job_id}')
 
 
-@scheduler.event_listener(mask=EVENT_JOB_EXECUTED)
+@scheduler.event_listener(mask=EVENT_JOB_SUBMITTED)
+def _(event: JobSubmissionEvent):
+    job_submitted[event.job_id] = time.monotonic()
+
+
+@scheduler.event_listener(mask=EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
 def _(event: JobExecutionEvent):
+    submitted = job_submitted.pop(event.job_id, None)
+
+    metrics = get_job_metrics(event.job_id)
+    if metrics:
+        metrics.runs += 1
+
+        if event.exception:
+            metrics.errors += 1
+
+        if submitted is not None:
+            metrics.runtime.observe((time.monotonic() - submitted) * 1000)
+
     log.debug(f'timed task executed: {event.job_id}')
+
+
+@scheduler.event_listener(mask=EVENT_JOB_MISSED)
+def _(event: JobExecutionEvent):
+    metrics = get_job_metrics(event.job_id)
+    if metrics:
+        metrics.missed += 1
+
+    log.warning(f'timed task missed: {event.job_id}')
+
+
+@scheduler.event_listener(mask=EVENT_JOB_MAX_INSTANCES)
+def _(event: JobSubmissionEvent):
+    metrics = get_job_metrics(event.job_id)
+    if metrics:
+        metrics.skipped += 1
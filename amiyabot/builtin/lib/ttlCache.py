@@ -0,0 +1,53 @@
+import time
+
+from typing import Any, Hashable, Optional
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        """
+        带过期时间的 LRU 缓存
+
+        :param max_size: 最大条目数，超出时淘汰最久未使用的条目
+        :param ttl:      默认过期时间（秒），为 None 时不过期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.data: OrderedDict[Hashable, tuple] = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, default: Any = None):
+        if key not in self.data:
+            return default
+
+        value, expire_at = self.data[key]
+        if expire_at is not None and expire_at <= time.monotonic():
+            del self.data[key]
+            return default
+
+        self.data.move_to_end(key)
+
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self.ttl
+
+        self.data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self.data.move_to_end(key)
+
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None):
+        item = self.data.pop(key, None)
+        return item[0] if item else default
+
+    def clear(self):
+        self.data.clear()
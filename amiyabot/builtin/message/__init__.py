@@ -47,6 +47,7 @@ class EventList:
 class Message(MessageStructure):
     async def send(self, reply: T_Chain) -> Optional['MessageCallbackType']:
         async with self.bot.processing_context(reply, self.factory_name):
+            reply.prerender()
             callbacks: List[MessageCallback] = await self.instance.send_chain_message(reply, is_sync=True)
 
         if not callbacks:
@@ -1,5 +1,6 @@
 import re
 
+from functools import partial
 from amiyabot.builtin.message import MessageStructure
 from amiyabot.builtin.lib.imageCreator import create_image, IMAGES_TYPE
 
@@ -16,6 +17,8 @@ MAX_SEAT = IMAGE_WIDTH - PADDING * 2
 class ChainConfig:
     max_length = argv('text-max-length', int) or 100
     md_template = os.path.join(cur_file_folder, '../../_assets/markdown/template.html')
+    # Markdown 模板中需要截取的元素，替换模板时同时修改，找不到该元素时截取整个页面
+    md_selector = '.markdown-body'
 
 
 class Chain:
@@ -119,17 +122,22 @@ class Chain:
         height: Optional[int] = None,
         bgcolor: str = '#F5F5F5',
     ):
-        return self.image(
-            target=create_image(
-                text,
-                images=(images or []),
-                width=width,
-                height=height,
-                padding=PADDING,
-                max_seat=MAX_SEAT,
-                bgcolor=bgcolor,
+        self.chain.append(
+            Image(
+                builder=self.builder,
+                render=partial(
+                    create_image,
+                    text,
+                    images=(images or []),
+                    width=width,
+                    height=height,
+                    padding=PADDING,
+                    max_seat=MAX_SEAT,
+                    bgcolor=bgcolor,
+                ),
             )
         )
+        return self
 
     def image(self, target: Optional[Union[str, bytes, List[Union[str, bytes]]]] = None, url: Optional[str] = None):
         if url:
@@ -164,6 +172,7 @@ class Chain:
         height: int = DEFAULT_HEIGHT,
         is_template: bool = True,
         render_time: int = DEFAULT_RENDER_TIME,
+        selector: Optional[str] = None,
     ):
         self.chain.append(
             Html(
@@ -174,6 +183,7 @@ class Chain:
                 is_file=is_template,
                 render_time=render_time,
                 builder=self.builder,
+                selector=selector,
             )
         )
         return self
@@ -197,6 +207,7 @@ class Chain:
                 'is_dark': is_dark,
             },
             render_time=render_time,
+            selector=ChainConfig.md_selector,
         )
 
     def markdown_template(
@@ -220,3 +231,11 @@ class Chain:
     def extend(self, data: Any):
         self.chain.append(Extend(data))
         return self
+
+    def prerender(self):
+        """
+        并发地开始渲染消息链中的 Html 与文字图片，构建消息时将直接使用渲染结果
+        """
+        for item in self.chain:
+            if isinstance(item, (Html, Image)):
+                item.prerender()
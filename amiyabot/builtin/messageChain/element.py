@@ -1,8 +1,10 @@
 import os
 import json
+import math
+import asyncio
 
-from typing import List, Any
-from dataclasses import dataclass
+from typing import List, Any, Callable
+from dataclasses import dataclass, field
 from amiyabot.builtin.lib.browserService import *
 from amiyalog import logger as log
 
@@ -55,8 +57,19 @@ class Image:
     url: Optional[str] = None
     content: Optional[bytes] = None
     builder: Optional[ChainBuilder] = None
+    render: Optional[Callable[[], bytes]] = None
+    render_task: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+
+    def prerender(self):
+        if self.render and self.content is None and not self.render_task:
+            self.render_task = asyncio.create_task(asyncio.to_thread(self.render))
 
     async def get(self):
+        if self.content is None and self.render:
+            self.prerender()
+            self.content = await self.render_task
+            self.render_task = None
+
         if self.builder:
             res = await self.builder.get_image(self.url or self.content)
             if res:
@@ -100,56 +113,142 @@ class Html:
     width: int = DEFAULT_WIDTH
     height: int = DEFAULT_HEIGHT
     builder: Optional[ChainBuilder] = None
+    selector: Optional[str] = None
+    render_task: Optional[asyncio.Task] = field(default=None, init=False, repr=False)
+
+    def prerender(self):
+        if not self.render_task:
+            self.render_task = asyncio.create_task(self.__render())
+
+    async def __screenshot(self, page: Page):
+        if not self.selector:
+            return await page.screenshot(full_page=True)
+
+        rect = await self.__element_rect(page)
+        if not rect:
+            log.warning(f'element "{self.selector}" not found, fallback to full page screenshot.')
+            return await page.screenshot(full_page=True)
+
+        if not rect['width'] or not rect['height']:
+            log.warning(f'element "{self.selector}" has no size, fallback to full page screenshot.')
+            return await page.screenshot(full_page=True)
+
+        # 视口自适应：扩大视口使元素完整可见，然后只截取元素所在的区域
+        # 元素的布局可能随视口变化，扩大视口后需要重新测量，最多调整 3 次
+        for _ in range(3):
+            viewport = page.viewport_size
+            if not viewport or self.__rect_in_viewport(rect, viewport):
+                break
+
+            right = math.ceil(rect['x'] + rect['width'])
+            bottom = math.ceil(rect['y'] + rect['height'])
+
+            await page.set_viewport_size(
+                ViewportSize(width=max(right, viewport['width']), height=max(bottom, viewport['height']))
+            )
+            rect = await self.__element_rect(page)
+            if not rect:
+                return await page.screenshot(full_page=True)
+
+        viewport = page.viewport_size
+        if viewport and not self.__rect_in_viewport(rect, viewport):
+            # 调整后元素仍超出视口，截取的区域不完整，改为截取整个页面
+            log.warning(f'element "{self.selector}" exceeds the viewport, fallback to full page screenshot.')
+            return await page.screenshot(full_page=True)
+
+        return await page.screenshot(clip=rect)
+
+    async def __element_rect(self, page: Page):
+        element = await page.query_selector(self.selector)
+        if not element:
+            return None
+
+        return await element.evaluate(
+            '''
+            el => {
+                const rect = el.getBoundingClientRect()
+                return { x: rect.left, y: rect.top, width: rect.width, height: rect.height }
+            }
+            '''
+        )
+
+    @staticmethod
+    def __rect_in_viewport(rect: dict, viewport: ViewportSize):
+        return (
+            rect['x'] >= 0
+            and rect['y'] >= 0
+            and rect['x'] + rect['width'] <= viewport['width']
+            and rect['y'] + rect['height'] <= viewport['height']
+        )
 
     async def create_html_image(self):
+        if self.render_task:
+            task, self.render_task = self.render_task, None
+            return await task
+
+        return await self.__render()
+
+    async def __render(self):
         async with log.catch('browser service error:'):
-            page_context = await basic_browser_service.open_page(self.width, self.height)
+            url = 'file:///' + os.path.abspath(self.url) if self.is_file else self.url
+
+            page_context = await basic_browser_service.open_page(
+                self.width,
+                self.height,
+                template=url if self.is_file else None,
+            )
 
             if not page_context:
                 return None
 
             async with page_context as page:
                 async with log.catch('html convert error:'):
-                    url = 'file:///' + os.path.abspath(self.url) if self.is_file else self.url
-
                     try:
-                        await page.goto(url)
-                        await page.wait_for_load_state()
-                    except Exception as e:
-                        log.error(e, desc=f'can not goto url {url}. Error:')
-                        return None
-
-                    if self.data:
-                        injected = '''
-                            if ('init' in window) {
-                                init(%s)
-                            } else {
-                                console.warn(
-                                    'Can not execute "window.init(data)" because this function does not exist.'
-                                )
-                            }
-                        ''' % json.dumps(
-                            self.data
-                        )
-                        await page.evaluate(injected)
-
-                    # 等待渲染
-                    await asyncio.sleep(self.render_time / 1000)
-
-                    # 执行钩子
-                    if self.builder:
-                        await self.builder.on_page_rendered(page)
-
-                    # 截图
-                    result = await page.screenshot(full_page=True)
-
-                    if self.builder:
-                        res = await self.builder.get_image(result)
-                        if res:
-                            result = res
-
-                    if result:
-                        return result
+                        # 页面已停留在该模板上时跳过跳转，直接重新执行 init(data)
+                        if not (page_context.template_ready and self.data):
+                            try:
+                                await page.goto(url)
+                                await page.wait_for_load_state()
+                            except Exception as e:
+                                page_context.template = None
+                                log.error(e, desc=f'can not goto url {url}. Error:')
+                                return None
+
+                        if self.data:
+                            injected = '''
+                                if ('init' in window) {
+                                    init(%s)
+                                } else {
+                                    console.warn(
+                                        'Can not execute "window.init(data)" because this function does not exist.'
+                                    )
+                                }
+                            ''' % json.dumps(
+                                self.data
+                            )
+                            await page.evaluate(injected)
+
+                        # 等待渲染
+                        await asyncio.sleep(self.render_time / 1000)
+
+                        # 执行钩子
+                        if self.builder:
+                            await self.builder.on_page_rendered(page)
+
+                        # 截图
+                        result = await self.__screenshot(page)
+
+                        if self.builder:
+                            res = await self.builder.get_image(result)
+                            if res:
+                                result = res
+
+                        if result:
+                            return result
+                    except BaseException:
+                        # 渲染中途失败的页面状态不确定，归还后不再作为该模板的热页面复用
+                        page_context.template = None
+                        raise
 
 
 @dataclass
@@ -1,12 +1,32 @@
+import time
+import heapq
+import threading
 import peewee
+import asyncio
+import hashlib
 import pymysql
 
-from abc import ABC
-from typing import List, Any, Optional
+from abc import ABC, ABCMeta
+from typing import List, Dict, Any, Iterator, Optional
 from dataclasses import dataclass
 from playhouse.migrate import *
+from playhouse.pool import PooledDatabase, PooledMySQLDatabase, MaxConnectionsExceeded, _sentinel
 from playhouse.shortcuts import ReconnectMixin, model_to_dict
 from amiyautils import create_dir, pascal_case_to_snake_case
+from amiyabot.builtin.lib.histogram import Histogram
+from amiyabot.builtin.lib.ttlCache import TTLCache
+from amiyabot.builtin.lib.timedTask import TasksControl, Task
+from amiyalog import logger as log
+
+from .asyncDatabase import AsyncDatabase, async_database
+from .writeBuffer import WriteBuffer, get_write_buffer, flush_write_buffers
+from .queryCache import (
+    QueryCache,
+    QueryCacheHookMixin,
+    get_query_cache,
+    query_cache_enabled,
+    invalidate_query_cache,
+)
 
 
 @dataclass
@@ -25,7 +45,134 @@ class MysqlConfig:
         }
 
 
-class ReconnectMySQLDatabase(ReconnectMixin, MySQLDatabase, ABC): ...
+@dataclass
+class MysqlPoolConfig:
+    min_connections: int = 1
+    max_connections: int = 20
+    # 连接创建超过该时间（秒）后在归还或取出时关闭重建
+    stale_timeout: int = 300
+    # 连接数已满时等待空闲连接的最长时间（秒）
+    wait_timeout: int = 30
+    # 定期关闭过期的空闲连接并补足最小连接数的间隔（秒）
+    recycle_interval: int = 60
+
+
+# WAL 模式下读写互不阻塞，synchronous=NORMAL 仅在检查点时同步磁盘
+SQLITE_PERFORMANCE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 1,
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 2,
+}
+
+
+class ReconnectMySQLDatabase(QueryCacheHookMixin, ReconnectMixin, MySQLDatabase, ABC): ...
+
+
+class HookedSqliteDatabase(QueryCacheHookMixin, SqliteDatabase, ABC): ...
+
+
+class PooledReconnectMySQLDatabase(QueryCacheHookMixin, ReconnectMixin, PooledMySQLDatabase, metaclass=ABCMeta):
+    """
+    带最小连接数、空闲连接回收及取出等待统计的 MySQL 连接池。
+
+    prefill、recycle 及 stat 使用了 PooledDatabase 的内部属性（_connections、_in_use 等），
+    requirements.txt 中的 peewee 版本限定在 3.18.x，升级时需要同时检查这些属性
+    """
+
+    def __init__(self, database: str, min_connections: int = 1, **kwargs):
+        super().__init__(database, **kwargs)
+
+        self.min_connections = min_connections
+
+        # 取出连接的等待时间（毫秒）
+        self.checkout_wait = Histogram()
+        self.checkout_timeouts = 0
+
+        # 各线程的连接是否由事务隐式取出
+        self.implicit_checkout = threading.local()
+
+    def connect(self, reuse_if_open: bool = False):
+        # 显式取出、connection_context、autoconnect、begin 及断线重连均经过这里从池中取出连接
+        if not self.is_closed():
+            return super().connect(reuse_if_open)
+
+        self.implicit_checkout.active = False
+
+        begin = time.monotonic()
+        try:
+            return super().connect(reuse_if_open)
+        except MaxConnectionsExceeded:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            self.checkout_wait.observe((time.monotonic() - begin) * 1000)
+
+    def begin(self, isolation_level: Optional[str] = None):
+        implicit = self.is_closed()
+        super().begin(isolation_level)
+        if implicit:
+            self.implicit_checkout.active = True
+
+    def execute_sql(self, sql, params=None, commit=None):
+        # 同步使用时由 autoconnect 取出的连接在语句执行后归还到池中，不让线程一直占用连接
+        implicit = self.is_closed()
+        try:
+            return super().execute_sql(sql, params, commit)
+        finally:
+            if implicit and not self.in_transaction():
+                self.close()
+
+    def pop_transaction(self):
+        try:
+            return super().pop_transaction()
+        finally:
+            # 由事务隐式取出的连接在最外层事务结束后归还
+            if getattr(self.implicit_checkout, 'active', False) and not self.in_transaction():
+                self.implicit_checkout.active = False
+                self.close()
+
+    def prefill(self):
+        """
+        创建连接直到连接总数达到 min_connections
+        """
+        while True:
+            with self._pool_lock:
+                if len(self._connections) + len(self._in_use) >= self.min_connections:
+                    return
+
+            conn = super(PooledDatabase, self)._connect()
+
+            with self._pool_lock:
+                heapq.heappush(self._connections, (time.time(), _sentinel(), conn))
+
+    def recycle(self):
+        """
+        关闭超过 stale_timeout 的空闲连接，并补足最小连接数
+        """
+        with self._pool_lock:
+            connections = []
+            for item in self._connections:
+                if self._stale_timeout and self._is_stale(item[0]):
+                    self._close(item[2], close_conn=True)
+                else:
+                    connections.append(item)
+
+            heapq.heapify(connections)
+            self._connections = connections
+
+        self.prefill()
+
+    def stat(self):
+        return {
+            'min': self.min_connections,
+            'max': self._max_connections,
+            'in_use': len(self._in_use),
+            'idle': len(self._connections),
+            'checkout_wait': self.checkout_wait.dict(),
+            'checkout_timeouts': self.checkout_timeouts,
+        }
 
 
 class ModelClass(Model):
@@ -46,11 +193,88 @@ class ModelClass(Model):
         preserve: Optional[list] = None,
     ):
         conflict = {'update': update, 'preserve': preserve}
-        if isinstance(cls._meta.database, ReconnectMySQLDatabase):
+        # MySQL 的 ON DUPLICATE KEY UPDATE 不支持指定冲突字段，其他数据库则必须指定
+        if not isinstance(cls._meta.database, MySQLDatabase):
             conflict['conflict_target'] = conflict_target
 
         cls.insert(**insert).on_conflict(**conflict).execute()
 
+    @classmethod
+    def cached_query(cls, query: peewee.Select, ttl: int = 60, select_model: Optional[peewee.Select] = None):
+        """
+        读取并缓存查询结果（query_to_list 的格式）。需要在模型的 Meta 中设置 query_cache = True，
+        且模型使用 connect_database 创建的数据库（QueryCacheHookMixin）。
+
+        模型的 insert、update、delete 等写入查询执行后缓存失效，在事务中执行时事务结束后再次失效。
+        联表查询只会在本模型写入时失效，execute_sql 执行的语句不会使缓存失效
+
+        :param query:        查询
+        :param ttl:          缓存时间（秒）
+        :param select_model: 同 query_to_list
+        """
+        if not query_cache_enabled(cls):
+            raise TypeError(f'query cache of {cls.__name__} is not enabled, set "query_cache = True" in its Meta.')
+        if not isinstance(cls._meta.database, QueryCacheHookMixin):
+            raise TypeError(f'database of {cls.__name__} does not support query cache, use connect_database instead.')
+
+        return get_query_cache(cls).get(query, ttl, lambda: query_to_list(query.clone(), select_model))
+
+    @classmethod
+    async def async_cached_query(
+        cls,
+        query: peewee.Select,
+        ttl: int = 60,
+        select_model: Optional[peewee.Select] = None,
+    ):
+        return await async_database(cls._meta.database).run(cls.cached_query, query, ttl, select_model)
+
+    @classmethod
+    def write_buffer(cls, max_rows: Optional[int] = None, interval: Optional[float] = None) -> WriteBuffer:
+        """
+        获取模型的写缓冲，可同时修改其写入条件
+
+        :param max_rows: 缓冲的行数达到该值时立即写入
+        :param interval: 定时写入的间隔（秒）
+        """
+        return get_write_buffer(cls, max_rows, interval)
+
+    @classmethod
+    def buffered_insert(cls, row: dict):
+        """
+        缓冲的插入，写入失败时放回缓冲重试，连续失败超过 max_retries 次后逐行写入，丢弃无法写入的行（记录在 failed_rows）
+        """
+        get_write_buffer(cls).add_insert(row)
+
+    @classmethod
+    def buffered_insert_or_update(
+        cls,
+        insert: dict,
+        update: Optional[dict] = None,
+        conflict_target: Optional[list] = None,
+        preserve: Optional[list] = None,
+        key: Optional[Any] = None,
+    ):
+        """
+        缓冲的 insert_or_update，指定 key 时相同 key 的操作只保留最后一次
+        update 中含有自增等依赖旧值的表达式时不应指定 key
+        写入失败的处理同 buffered_insert
+        """
+        get_write_buffer(cls).add_upsert(key, (insert, update, conflict_target, preserve))
+
+    @classmethod
+    async def async_batch_insert(cls, rows: List[dict], chunk_size: int = 200):
+        await async_database(cls._meta.database).run(cls.batch_insert, rows, chunk_size)
+
+    @classmethod
+    async def async_insert_or_update(
+        cls,
+        insert: dict,
+        update: Optional[dict] = None,
+        conflict_target: Optional[list] = None,
+        preserve: Optional[list] = None,
+    ):
+        await async_database(cls._meta.database).run(cls.insert_or_update, insert, update, conflict_target, preserve)
+
 
 class DatabaseConfigError(Exception):
     def __init__(self, value: Any):
@@ -60,37 +284,102 @@ class DatabaseConfigError(Exception):
         return f'Expected MysqlConfig instance, got {self.value} instead'
 
 
+schema_registries: Dict[Database, Dict[str, str]] = {}
+
+
+class SchemaRegistry(Model):
+    table_name = CharField(primary_key=True)
+    fingerprint = CharField()
+    updated_at = IntegerField()
+
+    class Meta:
+        table_name = 'amiyabot_schema_registry'
+
+
+def schema_fingerprints(database: Database) -> Dict[str, str]:
+    if database not in schema_registries:
+        with SchemaRegistry.bind_ctx(database):
+            SchemaRegistry.create_table()
+            schema_registries[database] = {item.table_name: item.fingerprint for item in SchemaRegistry.select()}
+
+    return schema_registries[database]
+
+
+def schema_fingerprint(cls: ModelClass, model_columns: List[str]):
+    columns = []
+    for name in sorted(model_columns):
+        field: Field = getattr(cls, name)
+        columns.append(f'{name}:{field.field_type}:{field.null}:{field.unique}:{getattr(field, "max_length", "")}')
+
+    return hashlib.sha256('|'.join(columns).encode()).hexdigest()
+
+
 def table(cls: ModelClass) -> Any:
     database: Database = cls._meta.database
-    migrator: SchemaMigrator = SchemaMigrator.from_database(cls._meta.database)
 
     table_name = pascal_case_to_snake_case(cls.__name__)
 
     cls._meta.table_name = table_name
+
+    model_columns = [f for f, n in cls.__dict__.items() if type(n) in [peewee.FieldAccessor, peewee.ForeignKeyAccessor]]
+
+    # 模型结构与上次同步时一致且表仍存在时，跳过建表及字段比对
+    fingerprints = schema_fingerprints(database)
+    fingerprint = schema_fingerprint(cls, model_columns)
+    if fingerprints.get(table_name) == fingerprint and database.table_exists(table_name):
+        return cls
+
+    migrator: SchemaMigrator = SchemaMigrator.from_database(database)
+
     cls.create_table()
 
     description = database.execute_sql(f'select * from `{table_name}` limit 1').description
 
-    model_columns = [f for f, n in cls.__dict__.items() if type(n) in [peewee.FieldAccessor, peewee.ForeignKeyAccessor]]
     table_columns = [n[0] for n in description]
 
     migrate_list = []
+    migrate_plan = []
 
     # 取 AB 差集增加字段
     for f in set(model_columns) - set(table_columns):
         migrate_list.append(migrator.add_column(table_name, f, getattr(cls, f)))
+        migrate_plan.append(f'add column "{f}"')
 
     # 取 BA 差集删除字段
     for f in set(table_columns) - set(model_columns):
         migrate_list.append(migrator.drop_column(table_name, f))
+        migrate_plan.append(f'drop column "{f}"')
 
     if migrate_list:
+        log.warning(f'migrating table "{table_name}": ' + ', '.join(migrate_plan))
         migrate(*tuple(migrate_list))
 
+    with SchemaRegistry.bind_ctx(database):
+        SchemaRegistry.replace(table_name=table_name, fingerprint=fingerprint, updated_at=int(time.time())).execute()
+
+    fingerprints[table_name] = fingerprint
+
     return cls
 
 
-def connect_database(database: str, is_mysql: bool = False, config: Optional[MysqlConfig] = None):
+def connect_database(
+    database: str,
+    is_mysql: bool = False,
+    config: Optional[MysqlConfig] = None,
+    pool: Optional[MysqlPoolConfig] = None,
+    performance: bool = False,
+    maintain_interval: int = 3600,
+):
+    """
+    连接数据库
+
+    :param database:          数据库名或 SQLite 文件路径
+    :param is_mysql:          是否为 MySQL
+    :param config:            MySQL 连接配置
+    :param pool:              MySQL 连接池配置，为空时不使用连接池
+    :param performance:       SQLite 使用 WAL 等性能配置，并定期执行检查点及 optimize
+    :param maintain_interval: SQLite 维护任务的执行间隔（秒）
+    """
     if is_mysql:
         if not isinstance(config, MysqlConfig):
             raise DatabaseConfigError(config)
@@ -101,10 +390,67 @@ def connect_database(database: str, is_mysql: bool = False, config: Optional[Mys
         cursor.close()
         conn.close()
 
+        if pool:
+            db = PooledReconnectMySQLDatabase(
+                database,
+                min_connections=pool.min_connections,
+                max_connections=pool.max_connections,
+                stale_timeout=pool.stale_timeout,
+                timeout=pool.wait_timeout,
+                **config.dict(),
+            )
+            db.prefill()
+            add_mysql_pool_recycle_task(db, pool.recycle_interval)
+
+            return db
+
         return ReconnectMySQLDatabase(database, **config.dict())
 
     create_dir(database, is_file=True)
-    return SqliteDatabase(database, pragmas={'timeout': 30})
+
+    if performance:
+        db = HookedSqliteDatabase(database, pragmas={'timeout': 30, **SQLITE_PERFORMANCE_PRAGMAS})
+        add_sqlite_maintain_task(db, maintain_interval)
+
+        return db
+
+    return HookedSqliteDatabase(database, pragmas={'timeout': 30})
+
+
+def add_sqlite_maintain_task(db: SqliteDatabase, each: int):
+    async def maintain():
+        async with log.catch('sqlite maintain error:'):
+            await async_database(db).run(db.execute_sql, 'PRAGMA wal_checkpoint(TRUNCATE)')
+            await async_database(db).run(db.execute_sql, 'PRAGMA optimize')
+
+    TasksControl.add_timed_task(
+        Task(
+            func=maintain,
+            each=each,
+            tag='database',
+            sub_tag=f'sqlite_maintain.{db.database}',
+            run_when_added=False,
+            # 同一数据库文件多次连接时只保留最后一次注册的任务
+            kwargs={'replace_existing': True},
+        )
+    )
+
+
+def add_mysql_pool_recycle_task(db: PooledReconnectMySQLDatabase, each: int):
+    async def recycle():
+        async with log.catch('mysql pool recycle error:'):
+            await asyncio.to_thread(db.recycle)
+
+    TasksControl.add_timed_task(
+        Task(
+            func=recycle,
+            each=each,
+            tag='database',
+            sub_tag=f'mysql_pool_recycle.{db.database}',
+            run_when_added=False,
+            kwargs={'replace_existing': True},
+        )
+    )
 
 
 def convert_model(model, select_model: Optional[peewee.Select] = None) -> dict:
@@ -121,11 +467,124 @@ def query_to_list(query, select_model: Optional[peewee.Select] = None) -> List[d
     return [convert_model(item, select_model) for item in query]
 
 
-def select_for_paginate(select: peewee.ModelSelect, page: int, page_size: int):
+def iter_query(query: peewee.Select) -> Iterator[dict]:
+    """
+    逐行读取查询结果，不创建模型实例也不缓存结果集
+    """
+    yield from query.dicts().iterator()
+
+
+count_cache = TTLCache(max_size=1024)
+
+
+def count_select(select: peewee.Select, cache_ttl: Optional[int] = None, approximate: bool = False) -> int:
+    """
+    统计查询的总行数
+
+    :param select:      查询
+    :param cache_ttl:   缓存相同查询的结果（秒），为空时不缓存
+    :param approximate: MySQL 使用 EXPLAIN 的估算行数代替 count，其他数据库忽略此参数
+    """
+    database: Database = select.model._meta.database
+    sql, params = select.sql()
+
+    cache_key = (id(database), sql, repr(params), approximate)
+    if cache_ttl:
+        total = count_cache.get(cache_key)
+        if total is not None:
+            return total
+
+    if approximate and isinstance(database, MySQLDatabase):
+        cursor = database.execute_sql('EXPLAIN ' + sql, params)
+        columns = [item[0] for item in cursor.description]
+        total = int(cursor.fetchone()[columns.index('rows')] or 0)
+    else:
+        total = select.count()
+
+    if cache_ttl:
+        count_cache.set(cache_key, total, cache_ttl)
+
+    return total
+
+
+def select_for_paginate(
+    select: peewee.ModelSelect,
+    page: int,
+    page_size: int,
+    count_cache_ttl: Optional[int] = None,
+    approximate_count: bool = False,
+):
     return {
         'list': query_to_list(
             select.objects().paginate(page=page, paginate_by=page_size),
             select_model=select,
         ),
-        'total': select.count(),
+        'total': count_select(select, count_cache_ttl, approximate_count),
+    }
+
+
+def select_for_keyset(
+    select: peewee.ModelSelect,
+    key: Field,
+    after: Optional[Any] = None,
+    page_size: int = 20,
+    desc: bool = False,
+):
+    """
+    按 key 字段的游标分页，每页的查询耗时与页码无关
+
+    :param select:    查询
+    :param key:       排序且唯一的字段，通常为主键
+    :param after:     上一页返回的 next，为空时从第一页开始
+    :param page_size: 每页数量
+    :param desc:      是否倒序
+    :return:          {'list': 当前页数据, 'next': 下一页的游标，没有下一页时为 None}
+    """
+    query = select.order_by(key.desc() if desc else key.asc())
+    if after is not None:
+        query = query.where(key < after if desc else key > after)
+
+    rows = list(iter_query(query.limit(page_size)))
+
+    return {
+        'list': rows,
+        'next': rows[-1][key.name] if len(rows) == page_size else None,
     }
+
+
+async def async_query_to_list(query, select_model: Optional[peewee.Select] = None) -> List[dict]:
+    return await async_database(query.model._meta.database).run(query_to_list, query, select_model)
+
+
+async def async_select_for_paginate(
+    select: peewee.ModelSelect,
+    page: int,
+    page_size: int,
+    count_cache_ttl: Optional[int] = None,
+    approximate_count: bool = False,
+):
+    return await async_database(select.model._meta.database).run(
+        select_for_paginate,
+        select,
+        page,
+        page_size,
+        count_cache_ttl,
+        approximate_count,
+    )
+
+
+async def async_select_for_keyset(
+    select: peewee.ModelSelect,
+    key: Field,
+    after: Optional[Any] = None,
+    page_size: int = 20,
+    desc: bool = False,
+):
+    return await async_database(select.model._meta.database).run(
+        select_for_keyset,
+        select,
+        key,
+        after,
+        page_size,
+        desc,
+    )
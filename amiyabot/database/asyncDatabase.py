@@ -0,0 +1,155 @@
+import asyncio
+
+from typing import Any, Dict, Callable, Optional
+from functools import partial
+from contextvars import ContextVar
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from peewee import Database, SqliteDatabase
+from playhouse.pool import PooledDatabase
+
+
+class LaneTransaction:
+    def __init__(self, lane: ThreadPoolExecutor):
+        """
+        占用 lane 的事务（或保存点），同一时间只允许一个操作使用
+
+        :param lane: 事务所在的 lane
+        """
+        self.lane = lane
+        self.busy = False
+
+    @contextmanager
+    def use(self):
+        # 子任务会继承事务，并发使用时保存点与查询会在同一连接上交错，因此直接拒绝
+        if self.busy:
+            raise RuntimeError('transaction is being used by another task concurrently, await it sequentially instead.')
+
+        self.busy = True
+        try:
+            yield
+        finally:
+            self.busy = False
+
+
+class AsyncDatabase:
+    def __init__(self, database: Database, lanes: int = 4):
+        """
+        peewee 数据库的异步外观，查询在独立的线程中执行，不阻塞事件循环
+
+        每条 lane 是一个单线程执行器，peewee 的连接按线程保存，因此每条 lane 持有一个独立的连接，
+        所有 lane 组成一个连接池。事务在整个生命周期内独占一条 lane，保证事务内的查询使用同一个连接。
+
+        使用连接池数据库时，lane 只在执行期间（或事务期间）从池中取出连接，执行后即归还
+
+        :param database: peewee 数据库
+        :param lanes:    lane（连接）数量
+        """
+        self.database = database
+        self.pooled = isinstance(database, PooledDatabase)
+        self.lanes: asyncio.Queue[ThreadPoolExecutor] = asyncio.Queue()
+        self.executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'database-lane-{index}') for index in range(lanes)
+        ]
+        for executor in self.executors:
+            self.lanes.put_nowait(executor)
+
+        self.current_transaction: ContextVar[Optional[LaneTransaction]] = ContextVar(
+            f'database_transaction_{id(self)}', default=None
+        )
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        transaction = self.current_transaction.get()
+        if transaction:
+            with transaction.use():
+                return await self.__run_in_lane(transaction.lane, func, *args, **kwargs)
+
+        if self.pooled:
+            func = partial(self.__run_with_connection, func)
+
+        lane = await self.lanes.get()
+        try:
+            return await self.__run_in_lane(lane, func, *args, **kwargs)
+        finally:
+            self.lanes.put_nowait(lane)
+
+    @asynccontextmanager
+    async def atomic(self):
+        """
+        异步事务，嵌套使用时为保存点。事务内（包括其中创建的子任务）的 run 调用都在同一连接上执行，
+        但同一事务不能被多个任务并发使用，并发使用时抛出 RuntimeError
+        """
+        transaction = self.current_transaction.get()
+        if transaction:
+            # 保存点期间外层事务被占用，其中的操作使用新的 LaneTransaction
+            with transaction.use():
+                token = self.current_transaction.set(LaneTransaction(transaction.lane))
+                try:
+                    async with self.__transaction(transaction.lane):
+                        yield
+                finally:
+                    self.current_transaction.reset(token)
+            return
+
+        lane = await self.lanes.get()
+        token = self.current_transaction.set(LaneTransaction(lane))
+        try:
+            if self.pooled:
+                await self.__run_in_lane(lane, self.database.connect, reuse_if_open=True)
+            try:
+                async with self.__transaction(lane):
+                    yield
+            finally:
+                if self.pooled:
+                    await self.__run_in_lane(lane, self.database.close)
+        finally:
+            self.current_transaction.reset(token)
+            self.lanes.put_nowait(lane)
+
+    async def close(self):
+        if async_databases.get(self.database) is self:
+            del async_databases[self.database]
+
+        for _ in self.executors:
+            lane = await self.lanes.get()
+            await self.__run_in_lane(lane, self.database.close)
+            lane.shutdown()
+
+    @asynccontextmanager
+    async def __transaction(self, lane: ThreadPoolExecutor):
+        transaction = await self.__run_in_lane(lane, self.database.atomic)
+        await self.__run_in_lane(lane, transaction.__enter__)
+        try:
+            yield
+        except BaseException as e:
+            await self.__run_in_lane(lane, transaction.__exit__, type(e), e, e.__traceback__)
+            raise
+
+        await self.__run_in_lane(lane, transaction.__exit__, None, None, None)
+
+    def __run_with_connection(self, func: Callable, *args, **kwargs):
+        with self.database.connection_context():
+            return func(*args, **kwargs)
+
+    @staticmethod
+    async def __run_in_lane(lane: ThreadPoolExecutor, func: Callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(lane, partial(func, *args, **kwargs))
+
+
+async_databases: Dict[Database, AsyncDatabase] = {}
+
+
+def async_database(database: Database, lanes: Optional[int] = None) -> AsyncDatabase:
+    """
+    获取数据库对应的 AsyncDatabase，同一数据库只会创建一个
+
+    :param database: peewee 数据库
+    :param lanes:    首次创建时的 lane 数量，默认 SQLite 为 1，其他数据库为 4
+    """
+    if database not in async_databases:
+        if lanes is None:
+            lanes = 1 if isinstance(database, SqliteDatabase) else 4
+
+        async_databases[database] = AsyncDatabase(database, lanes)
+
+    return async_databases[database]
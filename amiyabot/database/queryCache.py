@@ -0,0 +1,125 @@
+import peewee
+import threading
+
+from typing import Any, Dict, List, Hashable, Callable, Optional
+from functools import partial
+from amiyabot.builtin.lib.ttlCache import TTLCache
+
+
+class QueryCache:
+    def __init__(self, max_size: int = 256):
+        """
+        模型的查询结果缓存，以查询的 SQL 及参数为键，模型发生写入时整体失效
+
+        :param max_size: 最多缓存的查询数
+        """
+        self.lock = threading.Lock()
+        self.cache = TTLCache(max_size)
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: Any, ttl: int, loader: Callable[[], List[dict]]) -> List[dict]:
+        sql, params = query.sql()
+        key = (sql, repr(params))
+
+        with self.lock:
+            generation = self.generation
+            rows = self.cache.get(key)
+
+        if rows is None:
+            self.misses += 1
+            rows = loader()
+
+            with self.lock:
+                # 读取期间发生了写入时不缓存，避免写入旧数据
+                if generation == self.generation:
+                    self.cache.set(key, rows, ttl)
+        else:
+            self.hits += 1
+
+        return [dict(item) for item in rows]
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.cache.clear()
+
+    def stat(self):
+        return {
+            'size': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+query_caches: Dict[Any, QueryCache] = {}
+
+
+def get_query_cache(model: Any) -> QueryCache:
+    if model not in query_caches:
+        query_caches[model] = QueryCache()
+
+    return query_caches[model]
+
+
+def invalidate_query_cache(model: Any):
+    cache: Optional[QueryCache] = query_caches.get(model)
+    if cache:
+        cache.invalidate()
+
+
+def query_cache_enabled(model: Any):
+    return bool(getattr(model._meta, 'query_cache', False))
+
+
+class QueryCacheHookMixin:
+    """
+    数据库扩展：开启了查询缓存（Meta.query_cache = True）的模型的写入查询执行后使缓存失效，
+    在事务中执行时，最外层事务结束（提交或回滚）后再次失效
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # 各线程当前事务结束后执行的回调
+        self.transaction_hooks = threading.local()
+
+    def on_transaction_end(self, key: Hashable, callback: Callable[[], Any]):
+        """
+        在当前线程最外层事务结束后执行回调，不在事务中时立即执行。同一事务中相同 key 的回调只执行一次
+        """
+        if not self.in_transaction():
+            callback()
+            return
+
+        if not hasattr(self.transaction_hooks, 'callbacks'):
+            self.transaction_hooks.callbacks = {}
+
+        self.transaction_hooks.callbacks[key] = callback
+
+    def pop_transaction(self):
+        try:
+            return super().pop_transaction()
+        finally:
+            if not self.in_transaction():
+                callbacks = getattr(self.transaction_hooks, 'callbacks', None)
+                if callbacks:
+                    self.transaction_hooks.callbacks = {}
+                    for callback in callbacks.values():
+                        callback()
+
+    def execute(self, query, *args, **kwargs):
+        try:
+            return super().execute(query, *args, **kwargs)
+        finally:
+            model = getattr(query, 'model', None)
+            if (
+                isinstance(query, (peewee.Insert, peewee.Update, peewee.Delete))
+                and model
+                and query_cache_enabled(model)
+            ):
+                invalidate_query_cache(model)
+                # 事务提交前其他线程仍可能读到旧数据并写入缓存，提交后需要再次失效
+                self.on_transaction_end(('query_cache', model), partial(invalidate_query_cache, model))
@@ -0,0 +1,182 @@
+import time
+import asyncio
+import threading
+
+from typing import Any, Dict, List, Hashable, Optional
+from peewee import chunked
+from amiyalog import logger as log
+from amiyabot.signalHandler import SignalHandler
+from amiyabot.builtin.lib.histogram import Histogram
+
+from .asyncDatabase import async_database
+
+
+class WriteBuffer:
+    def __init__(self, model: Any, max_rows: int = 500, interval: float = 5, max_retries: int = 3):
+        """
+        模型的写缓冲，插入及 upsert 先在内存中合并，按数量或时间间隔在一个事务中批量写入
+
+        :param model:       ModelClass 子类
+        :param max_rows:    缓冲的行数达到该值时立即写入
+        :param interval:    定时写入的间隔（秒）
+        :param max_retries: 写入失败时放回缓冲重试的次数，连续失败超过该次数后逐行写入并丢弃无法写入的行
+        """
+        self.model = model
+        self.max_rows = max_rows
+        self.interval = interval
+        self.max_retries = max_retries
+        self.retries = 0
+
+        self.lock = threading.Lock()
+        self.inserts: List[dict] = []
+        self.upserts: Dict[Hashable, tuple] = {}
+
+        self.timer: Optional[asyncio.Task] = None
+        self.flushing: Optional[asyncio.Task] = None
+
+        # 写入耗时（毫秒）
+        self.flush_latency = Histogram()
+        self.flushed_rows = 0
+        self.failed_rows = 0
+
+    @property
+    def backlog(self):
+        return len(self.inserts) + len(self.upserts)
+
+    def add_insert(self, row: dict):
+        with self.lock:
+            self.inserts.append(row)
+        self.__schedule()
+
+    def add_upsert(self, key: Optional[Hashable], args: tuple):
+        with self.lock:
+            # 相同 key 的 upsert 只保留最后一次，未指定 key 时按顺序全部执行
+            self.upserts[key if key is not None else object()] = args
+        self.__schedule()
+
+    def stat(self):
+        return {
+            'backlog': self.backlog,
+            'flushed_rows': self.flushed_rows,
+            'failed_rows': self.failed_rows,
+            'retries': self.retries,
+            'flush_latency': self.flush_latency.dict(),
+        }
+
+    def __schedule(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 没有事件循环时只能在满足数量时同步写入
+            if self.backlog >= self.max_rows:
+                self.flush()
+            return
+
+        if self.backlog >= self.max_rows and (not self.flushing or self.flushing.done()):
+            self.flushing = asyncio.create_task(self.async_flush())
+        elif not self.timer or self.timer.done():
+            self.timer = asyncio.create_task(self.__flush_later())
+
+    async def __flush_later(self):
+        # 写入失败的数据会放回缓冲，按间隔继续写入直到缓冲为空
+        while self.backlog:
+            await asyncio.sleep(self.interval)
+            await self.async_flush()
+
+    def __take(self):
+        with self.lock:
+            inserts, self.inserts = self.inserts, []
+            upserts, self.upserts = list(self.upserts.items()), {}
+
+        return inserts, upserts
+
+    def __restore(self, inserts: List[dict], upserts: List[tuple]):
+        with self.lock:
+            # 放回到缓冲的最前面，写入期间新增的相同 key 的 upsert 仍以新的为准
+            self.inserts = inserts + self.inserts
+            self.upserts = {**dict(upserts), **self.upserts}
+
+    def flush(self):
+        inserts, upserts = self.__take()
+        if inserts or upserts:
+            self.__write(inserts, upserts)
+
+    async def async_flush(self):
+        inserts, upserts = self.__take()
+        if inserts or upserts:
+            await async_database(self.model._meta.database).run(self.__write, inserts, upserts)
+
+            if self.backlog and (not self.timer or self.timer.done()):
+                self.timer = asyncio.create_task(self.__flush_later())
+
+    def __write(self, inserts: List[dict], upserts: List[tuple]):
+        rows = len(inserts) + len(upserts)
+
+        begin = time.monotonic()
+        try:
+            with self.model._meta.database.atomic():
+                for batch in chunked(inserts, 200):
+                    self.model.insert_many(batch).execute()
+                for _, args in upserts:
+                    self.model.insert_or_update(*args)
+
+            self.flushed_rows += rows
+            self.retries = 0
+        except Exception as e:
+            name = self.model.__name__
+            if self.retries < self.max_retries:
+                self.retries += 1
+                self.__restore(inserts, upserts)
+                log.warning(
+                    f'write buffer of {name} flush error, {rows} rows will be retried '
+                    f'({self.retries}/{self.max_retries}): {repr(e)}'
+                )
+            else:
+                # 重试耗尽后逐行写入，只丢弃本身无法写入的行
+                self.retries = 0
+                lost = self.__write_rows(inserts, upserts)
+                self.flushed_rows += rows - lost
+                self.failed_rows += lost
+                if lost:
+                    log.error(e, desc=f'write buffer of {name} flush error, {lost}/{rows} rows dropped:')
+        finally:
+            self.flush_latency.observe((time.monotonic() - begin) * 1000)
+
+    def __write_rows(self, inserts: List[dict], upserts: List[tuple]):
+        lost = 0
+        for item in inserts:
+            try:
+                self.model.insert(**item).execute()
+            except Exception:
+                lost += 1
+        for _, args in upserts:
+            try:
+                self.model.insert_or_update(*args)
+            except Exception:
+                lost += 1
+
+        return lost
+
+
+write_buffers: Dict[Any, WriteBuffer] = {}
+
+
+def get_write_buffer(model: Any, max_rows: Optional[int] = None, interval: Optional[float] = None):
+    if model not in write_buffers:
+        if not write_buffers:
+            SignalHandler.on_shutdown.append(flush_write_buffers)
+
+        write_buffers[model] = WriteBuffer(model)
+
+    buffer = write_buffers[model]
+    if max_rows is not None:
+        buffer.max_rows = max_rows
+    if interval is not None:
+        buffer.interval = interval
+
+    return buffer
+
+
+def flush_write_buffers():
+    for buffer in write_buffers.values():
+        buffer.flush()
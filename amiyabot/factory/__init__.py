@@ -6,7 +6,7 @@ import contextlib
 
 from amiyalog import logger as log
 from amiyautils import temp_sys_path, extract_zip, import_module, delete_module
-from amiyabot.builtin.lib.timedTask import TasksControl, Task
+from amiyabot.builtin.lib.timedTask import TasksControl, Task, process_task_args
 from amiyabot.builtin.lib.browserService import BrowserLaunchConfig
 
 from .factoryTyping import *
@@ -169,7 +169,12 @@ class BotHandlerFactory(FactoryCore):
         return handler
 
     def timed_task(
-        self, each: Optional[int] = None, sub_tag: str = 'default_tag', run_when_added: bool = False, **kwargs
+        self,
+        each: Optional[int] = None,
+        sub_tag: str = 'default_tag',
+        run_when_added: bool = False,
+        target: str = 'loop',
+        **kwargs,
     ):
         """
         注册定时任务
@@ -177,15 +182,32 @@ class BotHandlerFactory(FactoryCore):
         :param each:           循环执行间隔时间，单位（秒），如果使用其他触发方式，请使用 kwargs 形式的 scheduler.add_job 参数
         :param sub_tag:        子标签
         :param run_when_added: 添加时立即运行任务
+        :param target:         执行目标，loop：在事件循环中执行协程函数；
+                               thread：在线程池中执行普通函数；
+                               process：在进程池中执行模块级的普通函数。
+                               loop 及 thread 的任务函数接收当前实例作为参数，实例无法传入子进程，因此 process 的任务函数不接收参数
         :param kwargs:         scheduler.add_job 参数
         :return:
         """
 
-        def register(task: Callable[[BotHandlerFactory], Awaitable[None]]):
-            async def func():
-                async with log.catch('timed task error:'):
+        TasksControl.check_target(target)
+
+        def register(task: Callable):
+            if target == 'loop':
+
+                async def func():
                     await task(self)
 
+            elif target == 'thread':
+
+                def func():
+                    task(self)
+
+            else:
+                # 在注册时检查函数能否在子进程中导入及调用
+                process_task_args(task)
+                func = task
+
             timed_task_options = self.get_container('timed_tasks')
             timed_task_options.append(
                 Task(
@@ -196,6 +218,7 @@ class BotHandlerFactory(FactoryCore):
                         'sub_tag': f'{sub_tag}.key{len(timed_task_options)}',
                         'run_when_added': run_when_added,
                         'kwargs': kwargs,
+                        'target': target,
                     }
                 )
             )
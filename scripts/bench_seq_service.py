@@ -0,0 +1,66 @@
+"""
+SeqService 基准测试：跟踪 100k 个消息 ID 时，每秒一次的过期清理与 msg_req 的耗时
+
+与原先每秒重建整个字典的实现对比：
+
+    python scripts/bench_seq_service.py
+"""
+
+import time
+import timeit
+
+from amiyabot.adapters.tencent.qqGroup.builder import SeqService
+
+TRACKED = 100_000
+ROUNDS = 20
+
+
+class RebuildSeqService:
+    # 原先的实现：每秒用推导式重建整个字典
+    def __init__(self):
+        self.seq_rec = {}
+
+    def msg_req(self, msg_id: str):
+        if msg_id not in self.seq_rec:
+            self.seq_rec[msg_id] = {'last': time.time(), 'seq': 0}
+
+        self.seq_rec[msg_id]['seq'] += 1
+
+        return self.seq_rec[msg_id]['seq']
+
+    def evict(self):
+        self.seq_rec = {m_id: item for m_id, item in self.seq_rec.items() if time.time() - item['last'] < 300}
+
+
+def bench(name: str, service):
+    ids = [f'msg-{index}' for index in range(TRACKED)]
+
+    fill = timeit.timeit(lambda: [service.msg_req(msg_id) for msg_id in ids], number=1)
+    # 没有过期记录时的清理，即繁忙时每秒的常态开销
+    evict = min(timeit.repeat(service.evict, number=1, repeat=ROUNDS))
+    req = timeit.timeit(lambda: service.msg_req('msg-0'), number=TRACKED) / TRACKED
+
+    print(
+        f'{name:<10} fill {TRACKED} ids: {fill * 1000:8.2f} ms | '
+        f'evict (none expired): {evict * 1e6:9.2f} us | '
+        f'msg_req: {req * 1e6:6.3f} us'
+    )
+
+
+def bench_expire():
+    service = SeqService()
+    for index in range(TRACKED):
+        service.msg_req(f'msg-{index}')
+
+    service.expire = 0
+    begin = time.perf_counter()
+    service.evict(time.monotonic() + 1)
+    print(
+        f'SeqService evict {TRACKED} expired ids: {(time.perf_counter() - begin) * 1000:.2f} ms, left {len(service.seq_rec)}'
+    )
+
+
+if __name__ == '__main__':
+    bench('rebuild', RebuildSeqService())
+    bench('SeqService', SeqService())
+    bench_expire()
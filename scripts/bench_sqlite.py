@@ -0,0 +1,77 @@
+"""
+SQLite 并发读写基准测试：对比 connect_database 默认配置与 performance=True（WAL 等）下的读写吞吐
+
+多个读线程按主键查询，写线程不断插入小行（类似签到、计数器），固定时长后统计每秒的读写次数：
+
+    python scripts/bench_sqlite.py [读线程数] [写线程数] [时长（秒）]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+
+from peewee import CharField, IntegerField
+from amiyabot.database import ModelClass, connect_database
+
+READERS = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+WRITERS = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+DURATION = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+ROWS = 10_000
+
+
+def bench(name: str, performance: bool):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db = connect_database(path, performance=performance)
+
+    class SignIn(ModelClass):
+        user_id = CharField(unique=True)
+        count = IntegerField(default=0)
+
+        class Meta:
+            database = db
+
+    db.create_tables([SignIn])
+    SignIn.batch_insert([{'user_id': f'user-{index}'} for index in range(ROWS)])
+
+    counts = {'reads': 0, 'writes': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + DURATION
+
+    def reader():
+        reads = 0
+        while time.monotonic() < deadline:
+            SignIn.get_by_id(random.randint(1, ROWS))
+            reads += 1
+        with lock:
+            counts['reads'] += reads
+        db.close()
+
+    def writer(index: int):
+        writes = 0
+        while time.monotonic() < deadline:
+            SignIn.insert(user_id=f'writer-{index}-{writes}', count=1).execute()
+            writes += 1
+        with lock:
+            counts['writes'] += writes
+        db.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)]
+    threads += [threading.Thread(target=writer, args=(index,)) for index in range(WRITERS)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(
+        f'{name:<12} readers={READERS} writers={WRITERS}: '
+        f'{counts["reads"] / DURATION:10.0f} reads/s | {counts["writes"] / DURATION:8.0f} writes/s'
+    )
+
+
+if __name__ == '__main__':
+    bench('default', performance=False)
+    bench('performance', performance=True)